@@ -0,0 +1,80 @@
+import de.up.ling.irtg.Interpretation;
+import de.up.ling.irtg.InterpretedTreeAutomaton;
+import de.up.ling.irtg.automata.TreeAutomaton;
+import de.up.ling.irtg.codec.IrtgInputCodec;
+import de.up.ling.irtg.codec.OutputCodec;
+import de.up.ling.tree.Tree;
+
+import java.io.BufferedReader;
+import java.io.FileInputStream;
+import java.io.InputStreamReader;
+import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * Long-lived Alto parser for `alto_worker.py`.
+ *
+ * Loads one IRTG grammar once, then reads one English sentence per line
+ * from stdin and writes the varfree LF of its best parse (or <null>) as
+ * one line to stdout, like ParsingEvaluator with `-O semantics=cogs`.
+ * A sentence whose parse runs out of heap is reported as <timeout>.
+ * With `--derivations`, the LF is followed by a tab and the rule labels
+ * of the derivation in preorder.
+ *
+ * Run with the single-file source launcher (Java 11+):
+ *     java -cp alto-2.3.8-SNAPSHOT-all.jar AltoWorker.java grammar.irtg
+ */
+public class AltoWorker {
+    private static void collectLabels(
+        Tree<String> tree, List<String> labels
+    ) {
+        labels.add(tree.getLabel());
+        for (Tree<String> child : tree.getChildren()) {
+            collectLabels(child, labels);
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        boolean derivations =
+            args.length > 1 && args[1].equals("--derivations");
+        InterpretedTreeAutomaton irtg =
+            new IrtgInputCodec().read(new FileInputStream(args[0]));
+        Interpretation semantics = irtg.getInterpretation("semantics");
+        OutputCodec codec = OutputCodec.getOutputCodecByName("cogs");
+
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8)
+        );
+        PrintWriter out = new PrintWriter(System.out, false);
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String result = "<null>";
+            List<String> labels = new ArrayList<>();
+            try {
+                TreeAutomaton chart = irtg.parse(Map.of("english", line));
+                Tree<String> derivation = chart.viterbi();
+                if (derivation != null) {
+                    result = codec.asString(semantics.interpret(derivation));
+                    collectLabels(derivation, labels);
+                }
+            } catch (Exception e) {
+                // Unparseable sentences are reported as <null>
+                labels.clear();
+            } catch (OutOfMemoryError e) {
+                // The chart is garbage now, so the worker can go on
+                result = "<timeout>";
+                labels.clear();
+            }
+
+            if (derivations) {
+                result += "\t" + String.join(" ", labels);
+            }
+            out.println(result);
+            out.flush();
+        }
+    }
+}
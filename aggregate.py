@@ -0,0 +1,263 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy import stats
+from tabulate import tabulate
+
+from evaluate import (
+    BatchTable,
+    get_consistent_lines,
+    get_non_null_lines,
+    get_non_rep_lines,
+    get_role_mismatches
+)
+
+
+def get_response_paths(patterns):
+    """Response files matching any of the glob patterns, without repeats."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        paths.update(matches)
+    return sorted(paths)
+
+
+def evaluate_run(response_path, dataset_type):
+    """
+    Number of valid sentences per type and of valid batches of one run
+    after every check, as in `evaluate.py`.
+    """
+    batch_size = 6 if dataset_type == "batch" else 2
+    try:
+        table = BatchTable.load(response_path, batch_size)
+    except FileNotFoundError as e:
+        return {"response_path": response_path, "error": str(e)}
+
+    lines = {"parse": get_non_null_lines(table)}
+    if dataset_type == "batch":
+        lines["consistent"] = get_consistent_lines(table, lines["parse"])
+    else:
+        lines["consistent"] = lines["parse"]
+    lines["non_rep"] = get_non_rep_lines(table, lines["consistent"])
+
+    return {
+        "response_path": response_path,
+        "n_batches": table.lfs.shape[1],
+        "n_timeouts": int(table.timeouts.sum()),
+        "role_mismatches": get_role_mismatches(table, lines["parse"]),
+        "valid": {
+            check: {
+                "sents": valid_lines.sum(axis=1).tolist(),
+                "batches": int(valid_lines.all(axis=0).sum()),
+            }
+            for check, valid_lines in lines.items()
+        },
+    }
+
+
+def get_interval(accs, confidence):
+    """
+    Mean of per-run accuracies (runs along the first axis) and the bounds
+    of its t confidence interval (clipped to [0, 1]), which are NaN for a
+    single run.
+    """
+    mean = accs.mean(axis=0)
+    if len(accs) < 2:
+        return mean, np.full_like(mean, np.nan), np.full_like(mean, np.nan)
+
+    sem = accs.std(axis=0, ddof=1) / np.sqrt(len(accs))
+    half_width = sem * stats.t.ppf((1 + confidence) / 2, len(accs) - 1)
+    return (
+        mean,
+        np.clip(mean - half_width, 0, 1),
+        np.clip(mean + half_width, 0, 1)
+    )
+
+
+def to_json(values):
+    """Values as JSON numbers, with None for NaN."""
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def aggregate(results, confidence=0.95):
+    """
+    Accuracies per sentence type and of batches across runs: the mean
+    over runs with its confidence interval, and the pooled accuracy over
+    all sentences. Runs without any batch are left out.
+    """
+    runs = [r for r in results if "error" not in r and r["n_batches"]]
+    n_batches = np.array([r["n_batches"] for r in runs], dtype=float)
+
+    summary = {
+        "n_runs": len(runs),
+        "n_batches": int(n_batches.sum()),
+        "n_timeouts": sum(r["n_timeouts"] for r in runs),
+        "confidence": confidence,
+        "response_paths": [r["response_path"] for r in runs],
+        "role_mismatches": {},
+        "checks": {},
+    }
+    for r in runs:
+        for part, count in r["role_mismatches"].items():
+            summary["role_mismatches"][part] = (
+                summary["role_mismatches"].get(part, 0) + count
+            )
+    if not runs:
+        return summary
+
+    for check in runs[0]["valid"]:
+        # Accuracies of every run, one column per type and one of batches
+        valid = np.array([
+            r["valid"][check]["sents"] + [r["valid"][check]["batches"]]
+            for r in runs
+        ], dtype=float)
+        mean, low, high = get_interval(
+            valid / n_batches[:, None], confidence
+        )
+        pooled = valid.sum(axis=0) / n_batches.sum()
+        summary["checks"][check] = {
+            "sent_accs": {
+                "mean": to_json(mean[:-1]),
+                "ci_low": to_json(low[:-1]),
+                "ci_high": to_json(high[:-1]),
+                "pooled": to_json(pooled[:-1]),
+            },
+            "batch_acc": {
+                "mean": to_json(mean[-1:])[0],
+                "ci_low": to_json(low[-1:])[0],
+                "ci_high": to_json(high[-1:])[0],
+                "pooled": to_json(pooled[-1:])[0],
+            },
+        }
+
+    return summary
+
+
+def format_acc(mean, low, high):
+    if low is None:
+        return f"{mean:.2%}"
+    return f"{mean:.2%} [{low:.2%}, {high:.2%}]"
+
+
+def print_summary(summary):
+    checks = summary["checks"]
+    if not checks:
+        print("No runs to aggregate")
+        return
+
+    n_types = len(next(iter(checks.values()))["sent_accs"]["mean"])
+    table = []
+    for check, accs in checks.items():
+        sent_accs = accs["sent_accs"]
+        row = [check] + [
+            format_acc(*values) for values in zip(
+                sent_accs["mean"], sent_accs["ci_low"], sent_accs["ci_high"]
+            )
+        ]
+        batch_acc = accs["batch_acc"]
+        row.append(format_acc(
+            batch_acc["mean"], batch_acc["ci_low"], batch_acc["ci_high"]
+        ))
+        table.append(row)
+
+    print(tabulate(
+        table,
+        headers=(
+            ["Check"] + [f"Type {i+1}" for i in range(n_types)] + ["Batch"]
+        ),
+        tablefmt="fancy_grid"
+    ))
+    print(
+        f"\n{summary['n_runs']} runs, {summary['n_batches']} batches, "
+        f"{summary['n_timeouts']} timed out parses. Mean accuracy over "
+        f"runs with its {summary['confidence']:.0%} confidence interval."
+    )
+    if summary["role_mismatches"]:
+        print("Main-clause frame mismatches: " + ", ".join(
+            f"{part} {count}"
+            for part, count in summary["role_mismatches"].items()
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate the evaluation of many runs"
+    )
+    parser.add_argument(
+        "dataset_type",
+        choices=["batch", "slog"],
+        help="Type of generation of the runs (batch or slog)"
+    )
+    parser.add_argument(
+        "response_paths",
+        type=str,
+        nargs="+",
+        help=(
+            "Paths or glob patterns of the unformatted responses, e.g. "
+            "'generation/responses/batch-*.txt'"
+        )
+    )
+    parser.add_argument(
+        "-j", "--n_jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of runs to load in parallel (default: CPU count)"
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the intervals"
+    )
+    parser.add_argument(
+        "--json",
+        type=str,
+        help="Save the aggregate to this JSON file instead of printing it"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    if args.n_jobs < 1:
+        parser.error("--n_jobs must be at least 1")
+
+    response_paths = get_response_paths(args.response_paths)
+    if not response_paths:
+        parser.error("No responses match the given paths")
+
+    with ProcessPoolExecutor(max_workers=args.n_jobs) as executor:
+        results = list(executor.map(
+            partial(evaluate_run, dataset_type=args.dataset_type),
+            response_paths,
+            chunksize=max(1, len(response_paths) // (4 * args.n_jobs))
+        ))
+
+    for r in results:
+        if "error" in r:
+            print(f"Skipping {r['response_path']}: {r['error']}")
+        elif args.verbose:
+            print(f"Loaded {r['response_path']} ({r['n_batches']} batches)")
+
+    summary = aggregate(results, confidence=args.confidence)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print("Saved aggregate to", args.json)
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
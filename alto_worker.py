@@ -0,0 +1,319 @@
+import argparse
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from utils import null_lf, timeout_lf
+
+
+ALTO_JAR = os.getenv(
+    "ALTO_JAR", "../alto/build/libs/alto-2.3.8-SNAPSHOT-all.jar"
+)
+ALTO_WORKER_SOURCE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "AltoWorker.java"
+)
+
+# Parse budgets: seconds per sentence and per batch of sentences, extra
+# seconds for starting a parser, and the memory of a parser process
+SENTENCE_TIMEOUT = float(os.getenv("SENTENCE_TIMEOUT", 30))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", 1800))
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", 120))
+ALTO_MAX_HEAP = os.getenv("ALTO_MAX_HEAP", "4g")
+# Times a parser may be killed and restarted within one batch
+MAX_RESTARTS = int(os.getenv("MAX_RESTARTS", 5))
+
+
+def get_alto_command(grammar_path, derivations=False):
+    """
+    Command of a warm Alto parser for the given control grammar. With
+    `derivations`, every LF is followed by a tab and the rule labels of
+    its derivation in preorder.
+    """
+    return [
+        "java", f"-Xmx{ALTO_MAX_HEAP}", "-cp", ALTO_JAR, ALTO_WORKER_SOURCE,
+        grammar_path
+    ] + (["--derivations"] if derivations else [])
+
+
+def get_stub_command(lookup_path):
+    """
+    Command of the pure-Python stand-in worker, which answers from a TSV
+    file of sentences and their LFs instead of parsing.
+    """
+    return [sys.executable, os.path.abspath(__file__), lookup_path]
+
+
+def limit_memory(memory_limit):
+    """Function for `preexec_fn` capping the memory of a child process."""
+    def set_limit():
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    return set_limit
+
+
+class ParserWorker:
+    """
+    Client of one long-lived parser process.
+
+    The process reads one sentence per line and answers each with one
+    line holding its varfree LF or <null>, in the same order. It is
+    started on first use and kept alive until `close`, so the JVM start
+    and the grammar loading are only paid once.
+
+    A watchdog kills the process once a sentence takes longer than
+    `sentence_timeout` seconds or a call to `parse` longer than
+    `batch_timeout`. The sentence being parsed (or, once the batch budget
+    or the `max_restarts` restarts are spent, every remaining one) gets
+    <timeout>, and the process is restarted for the rest of the batch.
+    A process that exits on its own, e.g. because it failed to start or
+    ran out of its `memory_limit` (in bytes), raises `RuntimeError`.
+    """
+
+    def __init__(
+        self,
+        command,
+        sentence_timeout=SENTENCE_TIMEOUT,
+        batch_timeout=BATCH_TIMEOUT,
+        memory_limit=None,
+        max_restarts=MAX_RESTARTS
+    ):
+        self.command = command
+        self.sentence_timeout = sentence_timeout
+        self.batch_timeout = batch_timeout
+        self.memory_limit = memory_limit
+        self.max_restarts = max_restarts
+        self.process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the process unless it is running. Returns if it was."""
+        if self.process is not None and self.process.poll() is None:
+            return True
+
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            preexec_fn=(
+                limit_memory(self.memory_limit) if self.memory_limit
+                else None
+            ),
+        )
+        return False
+
+    def _write(self, process, sents):
+        try:
+            for sent in sents:
+                process.stdin.write(sent + "\n")
+            process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            # The process was killed by the watchdog
+            pass
+
+    def _parse_until_failure(self, sents, emit, batch_deadline):
+        """
+        Pass the LFs of the sentences to `emit` until the process is done
+        with them, killed by the watchdog or exits. Returns the number of
+        sentences parsed and whether the watchdog killed the process.
+        """
+        was_running = self.start()
+        process = self.process
+
+        sentence_deadline = time.monotonic() + (
+            self.sentence_timeout or math.inf
+        ) + (0 if was_running else STARTUP_TIMEOUT)
+        done = threading.Event()
+        killed = threading.Event()
+
+        def watch():
+            while not done.wait(0.1):
+                now = time.monotonic()
+                if now > sentence_deadline or now > batch_deadline:
+                    killed.set()
+                    process.kill()
+                    return
+
+        # Write from a separate thread, so neither side blocks on a full
+        # pipe while the other one waits
+        writer = threading.Thread(target=self._write, args=(process, sents))
+        watchdog = threading.Thread(target=watch, daemon=True)
+        writer.start()
+        watchdog.start()
+
+        n_parsed = 0
+        try:
+            for _ in sents:
+                line = process.stdout.readline()
+                if not line:
+                    break
+                emit(line.rstrip("\n"))
+                n_parsed += 1
+                sentence_deadline = time.monotonic() + (
+                    self.sentence_timeout or math.inf
+                )
+        finally:
+            done.set()
+            writer.join()
+            watchdog.join()
+
+        return n_parsed, killed.is_set()
+
+    def parse(self, sents, on_lf=None):
+        """
+        Parse the sentences, returning one LF (or <null>, or <timeout>) per
+        sentence. Each LF is also passed to `on_lf(idx, lf)` as soon as it
+        arrives.
+        """
+        sents = [" ".join(sent.split()) for sent in sents]
+        batch_deadline = time.monotonic() + (self.batch_timeout or math.inf)
+
+        lfs = []
+
+        def emit(lf):
+            lfs.append(lf)
+            if on_lf is not None:
+                on_lf(len(lfs) - 1, lf)
+
+        n_restarts = 0
+        with self._lock:
+            while len(lfs) < len(sents):
+                if time.monotonic() > batch_deadline:
+                    for _ in range(len(sents) - len(lfs)):
+                        emit(timeout_lf)
+                    break
+
+                rest = sents[len(lfs):]
+                n_parsed, killed = self._parse_until_failure(
+                    rest, emit, batch_deadline
+                )
+                if n_parsed == len(rest):
+                    break
+
+                if not killed:
+                    # A parser that exits on its own is broken (e.g. a bad
+                    # jar or grammar), so retrying would fail the same way
+                    returncode = self.process.wait()
+                    self.process = None
+                    raise RuntimeError(
+                        f"Parser worker {self.command} exited with code "
+                        f"{returncode} after {len(lfs)} / {len(sents)} "
+                        f"sentences"
+                    )
+
+                # The watchdog killed the process on the next sentence
+                self.close()
+                emit(timeout_lf)
+                n_restarts += 1
+                if n_restarts > self.max_restarts:
+                    for _ in range(len(sents) - len(lfs)):
+                        emit(timeout_lf)
+                    break
+
+        return lfs
+
+    def close(self):
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class ParserPool:
+    """
+    One warm `ParserWorker` per control grammar, all with the same
+    budgets. By default the workers run Alto (whose memory is capped by
+    `ALTO_MAX_HEAP` instead of `memory_limit`); any other worker command
+    can be given as `get_command`, e.g.
+    `lambda _: get_stub_command(lookup_path)` for tests.
+    """
+
+    def __init__(
+        self,
+        get_command=get_alto_command,
+        sentence_timeout=SENTENCE_TIMEOUT,
+        batch_timeout=BATCH_TIMEOUT,
+        memory_limit=None
+    ):
+        self.get_command = get_command
+        self.sentence_timeout = sentence_timeout
+        self.batch_timeout = batch_timeout
+        self.memory_limit = memory_limit
+        self.workers = {}
+        self._lock = threading.Lock()
+
+    def get_worker(self, grammar_path):
+        grammar_path = os.path.abspath(grammar_path)
+        with self._lock:
+            if grammar_path not in self.workers:
+                self.workers[grammar_path] = ParserWorker(
+                    self.get_command(grammar_path),
+                    sentence_timeout=self.sentence_timeout,
+                    batch_timeout=self.batch_timeout,
+                    memory_limit=self.memory_limit
+                )
+            return self.workers[grammar_path]
+
+    def parse(self, grammar_path, sents, on_lf=None):
+        return self.get_worker(grammar_path).parse(sents, on_lf=on_lf)
+
+    def close(self):
+        with self._lock:
+            for worker in self.workers.values():
+                worker.close()
+            self.workers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_lookup(lookup_path):
+    lookup = {}
+    with open(lookup_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if "\t" not in line:
+                continue
+            sent, lf = line.rstrip("\n").split("\t", 1)
+            lookup[" ".join(sent.split())] = lf
+    return lookup
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Pure-Python stand-in for the Alto parser worker: answers every "
+            "sentence on stdin with its LF from a lookup file"
+        )
+    )
+    parser.add_argument(
+        "lookup_path",
+        type=str,
+        help="TSV file with one sentence and its varfree LF per line"
+    )
+    args = parser.parse_args()
+
+    lookup = read_lookup(args.lookup_path)
+    for line in sys.stdin:
+        sys.stdout.write(lookup.get(" ".join(line.split()), null_lf) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
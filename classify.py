@@ -0,0 +1,172 @@
+import time
+from functools import reduce
+from itertools import product
+
+from irtg_parser import (
+    IrtgGrammar, ParseBudgetExceeded, Rule, evaluate, load_irtg, render
+)
+from utils import null_lf, timeout_lf
+
+
+COMBINED_GRAMMAR = "grammars/preprocessed-combined-6.irtg"
+
+
+def build_typed_grammar(grammar, signatures):
+    """
+    Annotate the states of a combined grammar with the control grammars
+    that can derive them, so one chart holds the parses of all of them.
+
+    `signatures` holds the rule signatures of each control grammar. Every
+    state becomes pairs (state, mask), where bit i of the mask is set if
+    the state can be derived with rules of the i-th control grammar
+    alone. This matters because the control grammars reuse state names
+    for different expansions, so a plain parse with the combined grammar
+    may mix the rules of several of them.
+    """
+    rule_masks = {}
+    for rule in grammar.rules:
+        mask = sum(
+            1 << i for i, control_signatures in enumerate(signatures)
+            if rule.signature in control_signatures
+        )
+        if mask:
+            rule_masks[rule] = mask
+
+    # Find the masks of every state bottom-up until nothing changes
+    state_masks = {}
+    typed_rules = {}
+    changed = True
+    while changed:
+        changed = False
+        for rule, rule_mask in rule_masks.items():
+            for child_masks in product(
+                *(state_masks.get(child, ()) for child in rule.children)
+            ):
+                if (rule, child_masks) in typed_rules:
+                    continue
+                mask = reduce(lambda a, b: a & b, child_masks, rule_mask)
+                typed_rules[rule, child_masks] = mask
+                if mask and mask not in state_masks.get(rule.lhs, ()):
+                    state_masks.setdefault(rule.lhs, set()).add(mask)
+                    changed = True
+
+    rules = [
+        Rule(
+            idx,
+            (rule.lhs, mask),
+            rule.label,
+            tuple(zip(rule.children, child_masks)),
+            rule.weight,
+            rule.english,
+            rule.semantics,
+        )
+        for idx, ((rule, child_masks), mask) in enumerate(typed_rules.items())
+        if mask
+    ]
+    final_states = [
+        (state, mask)
+        for state in grammar.final_states
+        for mask in state_masks.get(state, ())
+    ]
+    return IrtgGrammar(grammar.path, rules, final_states)
+
+
+class TypeClassifier:
+    """
+    Parser that tells which sentence types a sentence realises.
+
+    Every sentence is parsed once with the combined grammar, which
+    contains the rules of all control grammars. A sentence realises type
+    `i + 1` if it has a derivation that only uses rules of the i-th
+    control grammar, and the best such derivation gives the LF that
+    control grammar would give it.
+    """
+
+    def __init__(self, control_grammars, combined_grammar=COMBINED_GRAMMAR):
+        grammar = load_irtg(combined_grammar)
+        signatures = [
+            frozenset(rule.signature for rule in load_irtg(path).rules)
+            for path in control_grammars
+        ]
+
+        combined = {rule.signature for rule in grammar.rules}
+        missing = [
+            path for path, control_signatures
+            in zip(control_grammars, signatures)
+            if not control_signatures <= combined
+        ]
+        if missing:
+            raise ValueError(
+                f"{combined_grammar} lacks rules of {', '.join(missing)}"
+            )
+
+        self.n_types = len(control_grammars)
+        self.grammar = build_typed_grammar(grammar, signatures)
+
+    def parse(self, sent, timeout=None, max_items=None):
+        """
+        LF of the sentence under each control grammar: <null> for the
+        types it does not realise, or <timeout> for all of them if the
+        parse went over its budget.
+        """
+        try:
+            derivations = self.grammar.final_derivations(
+                sent.split(),
+                deadline=None if timeout is None else (
+                    time.monotonic() + timeout
+                ),
+                max_items=max_items
+            )
+        except ParseBudgetExceeded:
+            return [timeout_lf] * self.n_types
+
+        best = [None] * self.n_types
+        for (_, mask), (score, derivation) in derivations.items():
+            for i in range(self.n_types):
+                if mask >> i & 1 and (best[i] is None or score > best[i][0]):
+                    best[i] = (score, derivation)
+
+        return [
+            null_lf if item is None else render(evaluate(item[1]))
+            for item in best
+        ]
+
+
+def get_types(lfs):
+    """Indices of the types realised by a sentence with these LFs."""
+    return [
+        i for i, lf in enumerate(lfs) if lf not in (null_lf, timeout_lf)
+    ]
+
+
+def assign_types(types):
+    """
+    Re-bucket the sentences of one batch, where `types[i]` lists the types
+    realised by the sentence in slot i. Returns `order` such that slot k
+    should hold the sentence of slot `order[k]`, so that every sentence
+    realises its slot's type, or None if no such order exists. Sentences
+    keep their own slot unless another sentence can only go there.
+    """
+    n = len(types)
+    owner = [None] * n
+
+    def place(i, seen):
+        # Try the sentence's own slot first, then the other types it
+        # realises, displacing sentences that can move elsewhere
+        for k in sorted(types[i], key=lambda k: k != i):
+            if k in seen:
+                continue
+            seen.add(k)
+            if owner[k] is None or place(owner[k], seen):
+                owner[k] = i
+                return True
+        return False
+
+    for i in range(n):
+        if i in types[i]:
+            owner[i] = i
+    for i in range(n):
+        if i not in owner and not place(i, set()):
+            return None
+
+    return owner
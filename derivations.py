@@ -0,0 +1,175 @@
+import argparse
+import glob
+import os
+from functools import lru_cache
+
+import numpy as np
+from tabulate import tabulate
+
+from irtg_parser import load_irtg
+
+
+@lru_cache(maxsize=32)
+def _get_label_index(grammar):
+    index = {}
+    for rule in grammar.rules:
+        index.setdefault(rule.label, []).append(rule)
+    return index
+
+
+def get_rule_ids(grammar, labels):
+    """
+    Rule ids (indices into `grammar.rules`) of a derivation given as its
+    rule labels in preorder. A label that belongs to several rules (e.g.
+    in g6) is resolved by the state its parent expects.
+    """
+    if not labels:
+        return np.zeros(0, dtype=np.int32)
+
+    index = _get_label_index(grammar)
+    rule_ids = []
+    pos = 0
+
+    def visit(state):
+        nonlocal pos
+        label = labels[pos]
+        pos += 1
+        for rule in index.get(label, ()):
+            if (
+                rule.lhs == state if state is not None
+                else rule.lhs in grammar.final_states
+            ):
+                break
+        else:
+            raise ValueError(
+                f"No rule {label} for state {state} in {grammar.path}"
+            )
+
+        rule_ids.append(rule.idx)
+        for child in rule.children:
+            visit(child)
+
+    visit(None)
+    if pos != len(labels):
+        raise ValueError(f"Derivation has extra labels: {' '.join(labels)}")
+    return np.array(rule_ids, dtype=np.int32)
+
+
+def save_derivations(path, grammar_path, rule_ids):
+    """
+    Save the derivations of a sentence file as one `.npz` file: the rule
+    ids of all sentences concatenated, plus the offset of each sentence.
+    Sentences without a parse (None) have no rule ids.
+    """
+    rule_ids = [
+        np.zeros(0, dtype=np.int32) if ids is None else ids
+        for ids in rule_ids
+    ]
+    offsets = np.zeros(len(rule_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(ids) for ids in rule_ids])
+    np.savez_compressed(
+        path,
+        rule_ids=(
+            np.concatenate(rule_ids) if rule_ids
+            else np.zeros(0, dtype=np.int32)
+        ),
+        offsets=offsets,
+        grammar_path=np.array(grammar_path),
+        n_rules=np.array(len(load_irtg(grammar_path).rules)),
+    )
+
+
+def load_derivations(path):
+    """
+    Load a file written by `save_derivations`. Returns the grammar path
+    and the rule ids of every sentence.
+    """
+    with np.load(path) as data:
+        offsets = data["offsets"]
+        rule_ids = data["rule_ids"]
+        return str(data["grammar_path"]), [
+            rule_ids[start:end] for start, end in zip(offsets, offsets[1:])
+        ]
+
+
+def count_rule_usage(paths):
+    """
+    Number of times each rule was used over the derivation files, as a
+    map from each grammar path to an array indexed by rule id.
+    """
+    counts = {}
+    for path in paths:
+        with np.load(path) as data:
+            grammar_path = str(data["grammar_path"])
+            usage = np.bincount(
+                data["rule_ids"], minlength=int(data["n_rules"])
+            )
+        if grammar_path in counts:
+            counts[grammar_path] += usage
+        else:
+            counts[grammar_path] = usage
+    return counts
+
+
+def get_derivation_paths(response_path):
+    base, _ = os.path.splitext(os.path.basename(response_path))
+    return sorted(glob.glob(f"output/derivations/*/{base}.npz"))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count how often each grammar rule is used in a run"
+    )
+    parser.add_argument(
+        "response_paths",
+        type=str,
+        nargs="+",
+        help="Responses parsed with --derivations"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="Number of most used rules to show per grammar"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="List the rules that were never used"
+    )
+
+    args = parser.parse_args()
+
+    paths = [
+        path for response_path in args.response_paths
+        for path in get_derivation_paths(response_path)
+    ]
+    if not paths:
+        parser.error("No derivations found, parse with --derivations first")
+
+    counts = count_rule_usage(paths)
+    table = [
+        (grammar_path, len(usage), int((usage > 0).sum()), int(usage.sum()))
+        for grammar_path, usage in sorted(counts.items())
+    ]
+    print(tabulate(
+        table,
+        headers=["Grammar", "Rules", "Used", "Rule applications"],
+        tablefmt="fancy_grid"
+    ))
+
+    for grammar_path, usage in sorted(counts.items()):
+        rules = load_irtg(grammar_path).rules
+        if args.top:
+            print(f"\nMost used rules of {grammar_path}:")
+            for idx in np.argsort(-usage, kind="stable")[:args.top]:
+                print(f"  {rules[idx].label} ({rules[idx].lhs}): {usage[idx]}")
+        if args.verbose:
+            unused = np.flatnonzero(usage == 0)
+            print(f"\nUnused rules of {grammar_path} ({len(unused)}):")
+            for idx in unused:
+                print(f"  {rules[idx].label} ({rules[idx].lhs})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import argparse
-import re
+import json
+import os
+import time
 import numpy as np
 from tabulate import tabulate
-from utils import create_out_path
+from utils import create_out_path, null_lf, timeout_lf
 
 
 DET = ["the", "a"]
@@ -11,9 +13,15 @@ BY = ["by"]
 INF = ["to"]
 REL_PRON = ["that"]
 PP_LOC = ["on", "in", "beside"]
+IGNORE_LIST = DET + AUX + BY + INF + REL_PRON + PP_LOC
 
+# Roles of the main-clause frame compared by `get_consistent_lines`
+FRAME_ROLES = ["agent", "theme", "recipient"]
+FRAME_PARTS = ["predicate"] + FRAME_ROLES
+VARFREE_SYMBOLS = {"*", "(", ")", ",", "=", "."}
 
-def get_accuracies(valid_lines, verbose=False):
+
+def get_accuracies(valid_lines, timeout_lines=None, verbose=False):
     # Accuracy per sentence type
     sent_accs = valid_lines.mean(axis=1)
 
@@ -24,43 +32,195 @@ def get_accuracies(valid_lines, verbose=False):
     accs["sent_accs"] = sent_accs.tolist()
     accs["batch_acc"] = batch_acc.item()
 
+    # Parses that went over their time or memory budget, which count as
+    # invalid above but point to the parser rather than the sentence
+    if timeout_lines is not None:
+        sent_timeouts = timeout_lines.mean(axis=1)
+        accs["sent_timeouts"] = sent_timeouts.tolist()
+        accs["n_timeouts"] = int(timeout_lines.sum())
+
     if verbose:
         headers = ["Sentence Type", "Accuracy"]
         table = [
             (f"Type {i+1}", f"{acc:.2%}") for i, acc in enumerate(sent_accs)
         ]
+        if timeout_lines is not None:
+            headers.append("Timeouts")
+            table = [
+                row + (f"{rate:.2%}",)
+                for row, rate in zip(table, sent_timeouts)
+            ]
         print(tabulate(table, headers=headers, tablefmt="fancy_grid"))
         print(f"\nBatch Accuracy: {batch_acc:.2%}\n")
+        if timeout_lines is not None:
+            print(f"Timed out parses: {accs['n_timeouts']}\n")
 
     return accs
 
 
-def get_non_null_lines(
-    response_path, batch_size
-):
-    parses = []
-    for i in range(0, batch_size):
-        varfree_path = create_out_path(
+class MetricsLog:
+    """
+    Running totals of the evaluation of a run: the valid sentences per
+    type and the valid batches after every check, timed out parses,
+    frame mismatches and OOV counts.
+
+    Each loop appends its own counts as one line to a JSONL log at
+    `path`, which is flushed right away, so the metrics of a long run
+    take constant memory and survive a crash. `summary` gives the totals
+    at any time, and `load` rebuilds them from a log. The `info` of the
+    run (e.g. its configuration) is the first line of the log.
+    """
+
+    def __init__(self, path, info=None):
+        self.path = path
+        self.info = dict(info or {})
+        self.n_loops = 0
+        self.n_prompts = 0
+        self.n_evaluated = 0
+        self.n_timeouts = 0
+        self.valid = {}
+        self.valid_batches = {}
+        self.role_mismatches = {}
+        self.oov_counts = np.zeros(4, dtype=np.int64)
+
+        if info is not None:
+            self._write({"info": self.info})
+
+    def _write(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _add(self, record):
+        self.n_loops += 1
+        self.n_prompts += record["n_prompts"]
+        self.n_evaluated += record["n_evaluated"]
+        self.n_timeouts += record["n_timeouts"]
+        for check, valid in record["valid"].items():
+            if check not in self.valid:
+                self.valid[check] = np.zeros(len(valid), dtype=np.int64)
+                self.valid_batches[check] = 0
+            self.valid[check] += valid
+            self.valid_batches[check] += record["valid_batches"][check]
+        for part, count in record["role_mismatches"].items():
+            self.role_mismatches[part] = (
+                self.role_mismatches.get(part, 0) + count
+            )
+        self.oov_counts += record["oov_counts"]
+
+    def add_loop(
+        self,
+        valid_lines,
+        n_prompts,
+        timeout_lines=None,
+        role_mismatches=None,
+        oov_counts=None
+    ):
+        """
+        Add the masks of one loop, given as a map from the name of each
+        check to its [type, batch] mask, and append them to the log.
+        """
+        n_evaluated = next(iter(valid_lines.values())).shape[1]
+        record = {
+            "loop": self.n_loops + 1,
+            "n_prompts": n_prompts,
+            "n_evaluated": n_evaluated,
+            "n_timeouts": (
+                0 if timeout_lines is None else int(timeout_lines.sum())
+            ),
+            "valid": {
+                check: lines.sum(axis=1).tolist()
+                for check, lines in valid_lines.items()
+            },
+            "valid_batches": {
+                check: int(lines.all(axis=0).sum())
+                for check, lines in valid_lines.items()
+            },
+            "role_mismatches": dict(role_mismatches or {}),
+            "oov_counts": [int(c) for c in oov_counts or (0, 0, 0, 0)],
+        }
+        self._add(record)
+        self._write(record)
+        return record
+
+    @classmethod
+    def load(cls, path):
+        """
+        Rebuild the totals from a log, e.g. of a run that crashed. A last
+        line cut off by the crash is ignored.
+        """
+        log = cls(path)
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "info" in record:
+                    log.info = record["info"]
+                else:
+                    log._add(record)
+        return log
+
+    def summary(self):
+        """
+        Totals so far: the accuracies of every check over all evaluated
+        batches, timeouts, frame mismatches and OOV percentages.
+        """
+        oov_count, n_words, oov_sents, n_sents = self.oov_counts.tolist()
+        summary = dict(self.info)
+        summary.update({
+            "n_loops": self.n_loops,
+            "n_prompts_total": self.n_prompts,
+            "n_evaluated": self.n_evaluated,
+            "n_timeouts": self.n_timeouts,
+            "accs": {
+                check: {
+                    "sent_accs": (
+                        valid / max(self.n_evaluated, 1)
+                    ).tolist(),
+                    "batch_acc": (
+                        self.valid_batches[check] / max(self.n_evaluated, 1)
+                    ),
+                }
+                for check, valid in self.valid.items()
+            },
+            "role_mismatches": dict(self.role_mismatches),
+            "oov_count": oov_count,
+            "n_words": n_words,
+            "oov_sents": oov_sents,
+            "n_sents_parsed": n_sents,
+            "oov_pct_total": oov_count / n_words if n_words else 0.0,
+            "oov_pct_sent": oov_sents / n_sents if n_sents else 0.0,
+        })
+        return summary
+
+
+def get_varfree_paths(response_path, batch_size):
+    return [
+        create_out_path(
             f"output/varfree_lf/{i + 1}/",
             response_path,
             check_exists=False,
             ext=".txt"
         )
+        for i in range(0, batch_size)
+    ]
 
-        with open(varfree_path, "r") as f:
-            lines = [line.strip() for line in f.readlines()]
 
-        bools = np.array([line != "<null>" for line in lines], dtype=bool)
-        parses.append(bools)
-
-    return np.stack(parses)
+def read_varfree_lines(response_path, batch_size):
+    lines = []
+    for varfree_path in get_varfree_paths(response_path, batch_size):
+        with open(varfree_path, "r") as f:
+            lines.append([line.strip() for line in f.readlines()])
 
+    return lines
 
-def get_non_rep_lines(response_path, non_null_lines, batch_size):
-    en_lines = []
-    ignore_list = DET + AUX + BY + INF + REL_PRON + PP_LOC
-    n_repetitions = 0
 
+def read_english_lines(response_path, batch_size):
+    """Sentences of every type, one read per sentence file."""
+    lines = []
     for i in range(0, batch_size):
         sent_path = create_out_path(
             f"output/english/{i + 1}/",
@@ -68,68 +228,345 @@ def get_non_rep_lines(response_path, non_null_lines, batch_size):
             check_exists=False,
             ext=".txt"
         )
-
         with open(sent_path, "r") as f:
-            en_lines = [
-                line for line in f.readlines()
+            lines.append([
+                line.strip() for line in f
                 if line.strip() and not line.startswith("//")
-            ]
+            ])
+
+    return lines
+
+
+def tail_lf_records(varfree_paths, n_lines, done=None, poll_interval=0.05):
+    """
+    Follow the LF files of all sentence types while the parser is still
+    writing them, yielding (type index, sentence index, LF) as soon as a
+    line is complete. Stops once `n_lines[i]` lines were read from every
+    file, or once `done()` is true and no more lines arrive.
+    """
+    files = [None] * len(varfree_paths)
+    partial = [""] * len(varfree_paths)
+    counts = [0] * len(varfree_paths)
+
+    try:
+        while any(count < n for count, n in zip(counts, n_lines)):
+            # Check before reading, so lines written before the parser
+            # finished are still read below
+            finished = done is not None and done()
+            progress = False
+
+            for i, varfree_path in enumerate(varfree_paths):
+                if files[i] is None:
+                    if not os.path.exists(varfree_path):
+                        continue
+                    files[i] = open(varfree_path, "r")
+
+                while counts[i] < n_lines[i]:
+                    line = files[i].readline()
+                    if not line:
+                        break
+                    partial[i] += line
+                    if not partial[i].endswith("\n"):
+                        break
+                    yield i, counts[i], partial[i].strip()
+                    partial[i] = ""
+                    counts[i] += 1
+                    progress = True
+
+            if finished:
+                break
+            if not progress:
+                time.sleep(poll_interval)
+    finally:
+        for f in files:
+            if f is not None:
+                f.close()
+
+
+def stream_parse_lines(response_path, batch_size, n_lines=None, done=None):
+    """
+    Counterpart of `get_non_null_lines` and `get_timeout_lines` that
+    builds both masks from the LF files while they are being written, so
+    evaluation overlaps with parsing. Returns the two masks and the LFs
+    of every sentence type. Sentences whose LF never arrived (if the
+    parser stopped early) count as invalid.
+
+    Pass the number of sentences per type from before parsing as
+    `n_lines` if the parser may rewrite the sentence files (see
+    `parse.classify_sents`).
+    """
+    if n_lines is None:
+        n_lines = [
+            len(lines)
+            for lines in read_english_lines(response_path, batch_size)
+        ]
+    n_sents = max(n_lines, default=0)
+    non_null_lines = np.zeros((batch_size, n_sents), dtype=bool)
+    timeout_lines = np.zeros((batch_size, n_sents), dtype=bool)
+    vf_lines = [[null_lf] * n for n in n_lines]
+
+    for i, j, lf in tail_lf_records(
+        get_varfree_paths(response_path, batch_size), n_lines, done=done
+    ):
+        non_null_lines[i, j] = lf not in (null_lf, timeout_lf)
+        timeout_lines[i, j] = lf == timeout_lf
+        vf_lines[i][j] = lf
+
+    return non_null_lines, timeout_lines, vf_lines
+
+
+def encode_tokens(sents):
+    """
+    Integer-encode the tokens of an array of sentences. Returns the
+    vocabulary and an int32 array of token ids of shape
+    `sents.shape + (max_len,)`, padded with -1.
+    """
+    # Split all sentences at once and intern the tokens with a dict, which
+    # is much faster than lists of tokens per sentence and `np.unique`
+    shape = sents.shape
+    sents = sents.ravel().tolist()
+    lengths = np.fromiter(
+        map(len, map(str.split, sents)), dtype=np.int64, count=len(sents)
+    )
+    flat = " ".join(sents).split()
+    vocab = list(dict.fromkeys(flat))
+    index = {token: idx for idx, token in enumerate(vocab)}
+    ids = np.fromiter(
+        map(index.__getitem__, flat), dtype=np.int32, count=len(flat)
+    )
+    vocab = np.array(vocab, dtype=object)
+
+    max_len = lengths.max(initial=0)
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(sents)), lengths)
+    cols = np.arange(len(ids)) - np.repeat(starts, lengths)
+    tokens = np.full((len(sents), max_len), -1, dtype=np.int32)
+    tokens[rows, cols] = ids
+
+    return vocab, tokens.reshape(shape + (max_len,))
+
+
+def encode_frames(lfs):
+    """
+    Main-clause frames (see `get_frame`) of an array of LFs. Returns the
+    vocabulary and an int32 array of ids of shape
+    `lfs.shape + (len(FRAME_PARTS),)`, -1 where an LF has no frame.
+    """
+    index = {}
+    no_frame = [-1] * len(FRAME_PARTS)
+    frames = [
+        no_frame if frame[0] is None
+        else [index.setdefault(part, len(index)) for part in frame]
+        for frame in map(get_frame, lfs.ravel().tolist())
+    ]
+    frames = np.array(frames, dtype=np.int32).reshape(
+        lfs.shape + (len(FRAME_PARTS),)
+    )
+    return np.array(list(index), dtype=object), frames
+
+
+class BatchTable:
+    """
+    Columnar view of the sentences and parses of one response, read once
+    and shared by every evaluation pass and the filtering step.
+
+    All arrays are indexed by [sentence type, batch]: `english` and `lfs`
+    hold the sentences and their varfree LFs, `tokens` the token ids of
+    the sentences (see `encode_tokens`), `frames` the main-clause frames
+    of the LFs (see `encode_frames`), and `non_null` and `timeouts` are
+    the masks of sentences with a parse and of timed out parses.
+    """
+
+    def __init__(self, english, lfs):
+        self.english = english
+        self.lfs = lfs
+        self.non_null = (lfs != null_lf) & (lfs != timeout_lf)
+        self.timeouts = lfs == timeout_lf
+        self.vocab, self.tokens = encode_tokens(english)
+        self.frame_vocab, self.frames = encode_frames(lfs)
+
+    @classmethod
+    def from_lines(cls, english_lines, lf_lines):
+        """
+        Build the table from the lines of every sentence type. Missing
+        lines (if a type has fewer sentences) count as unparsed.
+        """
+        n_sents = max(
+            (len(lines) for lines in english_lines + lf_lines), default=0
+        )
+        english = np.full((len(english_lines), n_sents), "", dtype=object)
+        lfs = np.full((len(lf_lines), n_sents), null_lf, dtype=object)
+        for i, (en_cur, lf_cur) in enumerate(zip(english_lines, lf_lines)):
+            english[i, :len(en_cur)] = en_cur
+            lfs[i, :len(lf_cur)] = lf_cur
+        return cls(english, lfs)
+
+    @classmethod
+    def load(cls, response_path, batch_size, lf_lines=None):
+        """
+        Read the table of a response. The LFs may already be known, e.g.
+        from `stream_parse_lines`.
+        """
+        if lf_lines is None:
+            lf_lines = read_varfree_lines(response_path, batch_size)
+        return cls.from_lines(
+            read_english_lines(response_path, batch_size), lf_lines
+        )
 
-        for j, line in enumerate(en_lines):
-            words = list(set(line.strip().split(" ")))
-            reps_list = [
-                w for w in words
-                if w not in ignore_list and line.count(w) > 1
-            ]
+    def select(self, valid_batches):
+        """Sentences and LFs of the valid batches, one row per batch."""
+        return (
+            self.english[:, valid_batches].T.tolist(),
+            self.lfs[:, valid_batches].T.tolist()
+        )
 
-            if reps_list:
-                n_repetitions += 1
-                non_null_lines[i, j] = False
 
-    return non_null_lines
+def get_non_null_lines(table):
+    return table.non_null.copy()
 
 
-def get_consistent_lines(response_path, non_null_lines, batch_size):
-    valid_lines = non_null_lines
-    valid_batches = non_null_lines.all(axis=0)
-    vf_lines = []
+def get_timeout_lines(table):
+    return table.timeouts.copy()
 
-    for i in range(0, batch_size):
-        varfree_path = create_out_path(
-            f"output/varfree_lf/{i + 1}/",
-            response_path,
-            check_exists=False,
-            ext=".txt"
-        )
 
-        with open(varfree_path, "r") as f:
-            vf_lines_cur = np.array(f.readlines(), dtype=object)
-        vf_lines.append(vf_lines_cur[valid_batches])
+def get_non_rep_lines(table, non_null_lines):
+    """
+    Mark sentences that repeat a content word as invalid. Function words
+    (see `IGNORE_LIST`) may occur any number of times.
+    """
+    tokens = table.tokens.reshape(
+        table.english.size, table.tokens.shape[-1]
+    )
+    ignored = np.isin(table.vocab, IGNORE_LIST)
+
+    # Sort the content words of every sentence, so repeated ones are
+    # neighbours. Padding and function words become -1 and sort first.
+    content = np.where(
+        (tokens >= 0) & ~ignored[np.maximum(tokens, 0)], tokens, -1
+    )
+    content.sort(axis=1)
+    repeated = (
+        (content[:, 1:] == content[:, :-1]) & (content[:, 1:] >= 0)
+    ).any(axis=1)
+
+    return non_null_lines & ~repeated.reshape(table.english.shape)
+
+
+def parse_varfree(lf):
+    """
+    Parse a varfree LF into a tree (head, definite, ((role, tree), ...)),
+    e.g. `* bear ( nmod . on = * podium )` into
+    ("bear", True, (("nmod . on", ("podium", True, ())),)).
+    Raises ValueError if the LF is malformed.
+    """
+    # The empty string marks the end, as `split` never yields it
+    tokens = lf.split() + [""]
+    # Terms whose arguments are being read, as [head, definite, args,
+    # role of the term in its parent]
+    stack = []
+    role = None
+    pos = 0
+
+    def error(pos):
+        return ValueError(f"Malformed varfree LF at token {pos}: {lf}")
+
+    def read_role(pos):
+        role = tokens[pos]
+        if not role or role in VARFREE_SYMBOLS:
+            raise error(pos)
+        pos += 1
+        while tokens[pos] == ".":
+            if not tokens[pos + 1] or tokens[pos + 1] in VARFREE_SYMBOLS:
+                raise error(pos + 1)
+            role += " . " + tokens[pos + 1]
+            pos += 2
+        if tokens[pos] != "=":
+            raise error(pos)
+        return role, pos + 1
+
+    while True:
+        definite = tokens[pos] == "*"
+        pos += definite
+        head = tokens[pos]
+        if not head or head in VARFREE_SYMBOLS:
+            raise error(pos)
+        pos += 1
+
+        if tokens[pos] == "(":
+            stack.append([head, definite, [], role])
+            role, pos = read_role(pos + 1)
+            continue
+
+        tree = (head, definite, ())
+        while stack:
+            stack[-1][2].append((role, tree))
+            if tokens[pos] == ",":
+                role, pos = read_role(pos + 1)
+                break
+            if tokens[pos] != ")":
+                raise error(pos)
+            pos += 1
+            head, definite, args, role = stack.pop()
+            tree = (head, definite, tuple(args))
+        else:
+            if tokens[pos]:
+                raise error(pos)
+            return tree
+
+
+def get_frame(lf):
+    """
+    Main-clause frame of a varfree LF: its predicate and the heads of its
+    `FRAME_ROLES`, with "" for missing roles. Unparsed or malformed LFs
+    have no frame (all None).
+    """
+    if lf in (null_lf, timeout_lf):
+        return (None,) * (len(FRAME_ROLES) + 1)
+    try:
+        head, _, args = parse_varfree(lf)
+    except ValueError:
+        return (None,) * (len(FRAME_ROLES) + 1)
+
+    args = dict(args)
+    return (head,) + tuple(
+        args[role][0] if role in args else "" for role in FRAME_ROLES
+    )
 
-    vf_lines = np.array(vf_lines, dtype=object).T.tolist()
 
-    pattern = re.compile(r'^(\w+)\s*\(\s*agent\s*=\s*\*?\s*(\w+)', re.M)
+def get_frame_mismatches(table, non_null_lines):
+    """
+    Which parts of the main-clause frame of each sentence differ from the
+    first sentence of its batch, as a boolean array of shape
+    `table.frames.shape`. Only batches that parsed completely are
+    compared.
+    """
+    valid_batches = non_null_lines.all(axis=0)
+    mismatches = (table.frames != table.frames[:1]) | (table.frames < 0)
+    mismatches[:, ~valid_batches] = False
+    return mismatches
 
-    for i, batch in enumerate(vf_lines, start=1):
-        verbs, agents = [], []
-        for line in batch:
-            m = pattern.match(line.strip())
-            if m:
-                verbs.append(m.group(1))
-                agents.append(m.group(2))
 
-        main_verb = verbs[0] if verbs else None
-        main_agent = agents[0] if agents else None
+def get_consistent_lines(table, non_null_lines, verbose=False):
+    mismatches = get_frame_mismatches(table, non_null_lines)
 
-        for j, (v, a) in enumerate(zip(verbs, agents)):
-            if v != main_verb or a != main_agent:
-                print(
-                    f"Batch {i+1}, sentence {j+1}: "
-                    f"Verb/agent mismatch (verb='{v}', agent='{a}')"
+    if verbose:
+        for j, i in np.argwhere(mismatches.any(axis=2)):
+            parts = ", ".join(
+                f"{part}='{table.frame_vocab[idx] if idx >= 0 else None}'"
+                for part, idx, mismatch in zip(
+                    FRAME_PARTS, table.frames[j, i], mismatches[j, i]
                 )
-                valid_lines[j, i] = False
+                if mismatch
+            )
+            print(f"Batch {i+1}, sentence {j+1}: Frame mismatch ({parts})")
+
+    return non_null_lines & ~mismatches.any(axis=2)
 
-    return valid_lines
+
+def get_role_mismatches(table, non_null_lines):
+    """Number of sentences whose frame differs in each part."""
+    mismatches = get_frame_mismatches(table, non_null_lines)
+    return dict(zip(FRAME_PARTS, mismatches.sum(axis=(0, 1)).tolist()))
 
 
 def main():
@@ -161,22 +598,34 @@ def main():
 
     batch_size = 6 if dataset_type == "batch" else 2
 
-    lines_non_null = get_non_null_lines(response_path, batch_size)
+    table = BatchTable.load(response_path, batch_size)
+    lines_non_null = get_non_null_lines(table)
+    lines_timeout = get_timeout_lines(table)
     print("Parse accuracies")
-    accs = get_accuracies(lines_non_null, verbose=verbose)
+    accs = get_accuracies(
+        lines_non_null, timeout_lines=lines_timeout, verbose=verbose
+    )
 
     if dataset_type == "batch":
         lines_consistent = get_consistent_lines(
-            response_path, lines_non_null, batch_size
+            table, lines_non_null, verbose=verbose
         )
-        print("Sentences w/ consistent main S/V")
+        print("Sentences w/ consistent main-clause frame")
         accs_cons = get_accuracies(lines_consistent, verbose=verbose)
+        accs_cons["role_mismatches"] = get_role_mismatches(
+            table, lines_non_null
+        )
+        if verbose:
+            print(tabulate(
+                accs_cons["role_mismatches"].items(),
+                headers=["Frame part", "Mismatches"],
+                tablefmt="fancy_grid"
+            ))
+            print()
     else:
         accs_cons = []
 
-    lines_non_rep = get_non_rep_lines(
-        response_path, lines_consistent, batch_size
-    )
+    lines_non_rep = get_non_rep_lines(table, lines_consistent)
     print("Non-repetition sentences")
     accs_rep = get_accuracies(lines_non_rep, verbose=verbose)
 
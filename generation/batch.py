@@ -0,0 +1,85 @@
+import json
+import os
+
+from generation.config import DEFAULT_MODEL
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def get_custom_id(run_id, idx):
+    # Zero-padded so that sorting the ids also sorts the prompts
+    return f"{run_id}-{idx:06d}"
+
+
+def write_batch_requests(
+    batch_path,
+    prompts,
+    model=DEFAULT_MODEL,
+    temperature=1.0,
+    top_p=1.0,
+    frequency_penalty=0.1,
+    presence_penalty=0.0
+):
+    """
+    Write one Batch API request per prompt into a JSONL file. The custom
+    ids are derived from the file name and the position of the prompt,
+    so the results can be put back into prompt order when ingested.
+    """
+    run_id = os.path.splitext(os.path.basename(batch_path))[0]
+    os.makedirs(os.path.dirname(batch_path) or ".", exist_ok=True)
+
+    custom_ids = []
+    with open(batch_path, "w", encoding="utf-8") as f:
+        for i, prompt in enumerate(prompts):
+            custom_id = get_custom_id(run_id, i)
+            request = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": temperature,
+                    "top_p": top_p,
+                    "frequency_penalty": frequency_penalty,
+                    "presence_penalty": presence_penalty,
+                },
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            custom_ids.append(custom_id)
+
+    return custom_ids
+
+
+def read_batch_results(results_path, verbose=False):
+    """
+    Read a Batch API output file and return the response contents in the
+    order of their custom ids. Failed requests are skipped as a whole, so
+    the remaining responses still consist of complete sentence batches.
+    """
+    results = {}
+    n_failed = 0
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                n_failed += 1
+                if verbose:
+                    print(
+                        f"Request {result['custom_id']} failed:",
+                        result.get("error") or response.get("status_code")
+                    )
+                continue
+
+            choice = response["body"]["choices"][0]
+            results[result["custom_id"]] = choice["message"]["content"]
+
+    if n_failed:
+        print(f"Skipped {n_failed} failed request(s) in {results_path}")
+
+    return [results[custom_id] for custom_id in sorted(results)]
@@ -0,0 +1,162 @@
+import math
+
+from generation.config import (
+    DEFAULT_MODEL,
+    MAX_BATCHES,
+    MODEL_LIMITS,
+    MODEL_PRICES,
+    TOKENS_PER_BATCH,
+)
+from generation.ctx_len import count_tokens
+from generation.prompt import prompt_from_grammar
+
+
+def estimate_prompt_tokens(
+    dataset_type,
+    grammar_path,
+    k,
+    model=DEFAULT_MODEL,
+    rec_depth=None,
+    n_samples=3,
+    approximate=False
+):
+    """
+    Average number of input tokens of a prompt built from the grammar.
+    The lexicon is subsampled at random, so a few prompts are measured.
+    With `approximate`, the tokenizer is not loaded and the count is
+    estimated from the length of the prompts.
+    """
+    counts = []
+    for _ in range(n_samples):
+        prompt = prompt_from_grammar(
+            dataset_type,
+            grammar_path,
+            n_batches=2,
+            k=k,
+            rec_depth=rec_depth,
+        )
+        counts.append(
+            count_tokens(
+                [{"role": "user", "content": prompt}],
+                model,
+                approximate=approximate
+            )
+        )
+
+    return math.ceil(sum(counts) / len(counts))
+
+
+def plan_budget(
+    dataset_type,
+    grammar_path,
+    k,
+    model=DEFAULT_MODEL,
+    context_limit=None,
+    output_limit=None,
+    tokens_per_batch=None,
+    max_batches=MAX_BATCHES,
+    rec_depth=None,
+    output_margin=0.9,
+    n_batches=None,
+    approximate=False
+):
+    """
+    Choose the number of batches per prompt: as many as fit the model's
+    context window and output limit, up to `max_batches`. The prompt is
+    paid once per request, so fuller responses always give more
+    sentences per token; the cap is what keeps responses short enough to
+    follow the prompt. Only `output_margin` of the output limit is
+    planned for, so that a longer than expected response is not cut off.
+
+    If `n_batches` is given, the plan is made for that number instead,
+    with a warning if it does not fit. `approximate` estimates the prompt
+    tokens without the tokenizer (see `estimate_prompt_tokens`).
+    """
+    limits = MODEL_LIMITS[model]
+    context_limit = context_limit or limits["context"]
+    output_limit = output_limit or limits["output"]
+    tokens_per_batch = tokens_per_batch or TOKENS_PER_BATCH[dataset_type]
+    sents_per_batch = 6 if dataset_type == "batch" else 1
+
+    prompt_tokens = estimate_prompt_tokens(
+        dataset_type,
+        grammar_path,
+        k,
+        model=model,
+        rec_depth=rec_depth,
+        approximate=approximate
+    )
+
+    n_max = min(
+        int(output_limit * output_margin) // tokens_per_batch,
+        (context_limit - prompt_tokens) // tokens_per_batch,
+    )
+    if n_batches is not None:
+        if n_batches > n_max:
+            print(
+                f"Warning: {n_batches} batches per prompt may not fit the "
+                f"limits of {model}, which leave room for {max(n_max, 0)}"
+            )
+    elif n_max < 1:
+        raise ValueError(
+            f"A prompt of {prompt_tokens} tokens leaves no room for a batch "
+            f"within the limits of {model}"
+        )
+    elif max_batches is not None:
+        n_batches = min(n_max, max_batches)
+    else:
+        n_batches = n_max
+
+    return {
+        "model": model,
+        "n_batches": n_batches,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": n_batches * tokens_per_batch,
+        "sents_per_prompt": n_batches * sents_per_batch,
+        "sents_per_token": n_batches * sents_per_batch / (
+            prompt_tokens + n_batches * tokens_per_batch
+        ),
+    }
+
+
+def project_cost(plan, n_prompts, prompts_per_unit=1):
+    """
+    Projected tokens and cost (in USD) of sending `n_prompts` prompts
+    following the given plan. For SLOG datasets, each prompt is sent once
+    per recursion depth, which `prompts_per_unit` accounts for.
+    """
+    n_requests = n_prompts * prompts_per_unit
+    input_tokens = n_requests * plan["prompt_tokens"]
+    output_tokens = n_requests * plan["output_tokens"]
+
+    prices = MODEL_PRICES.get(plan["model"])
+    cost = None
+    if prices is not None:
+        cost = (
+            input_tokens * prices["input"]
+            + output_tokens * prices["output"]
+        ) / 1e6
+
+    return {
+        "n_requests": n_requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": cost,
+    }
+
+
+def print_budget(plan, projection):
+    print("-----------")
+    print(
+        f"Batches per prompt: {plan['n_batches']} "
+        f"({plan['sents_per_prompt']} sentences, "
+        f"{plan['sents_per_token'] * 1000:.1f} per 1k tokens)"
+    )
+    print(
+        f"Projected tokens for {projection['n_requests']} request(s): "
+        f"{projection['input_tokens']} input, "
+        f"{projection['output_tokens']} output"
+    )
+    if projection["cost"] is not None:
+        print(f"Projected cost: ${projection['cost']:.2f}")
+    print("-----------")
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+
+from generation.config import CACHE_DIR, CACHE_MAX_BYTES
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for model responses.
+
+    Each response is stored in its own JSON file whose name is the hash
+    of the request (model, prompt, sampling parameters and sample index).
+    Once the cache grows beyond `max_bytes`, the least recently used
+    entries are evicted; a hit refreshes the entry's modification time.
+
+    With `replay=True` the cache is read-only: nothing is written or
+    evicted, and a miss raises a `KeyError` instead of calling the API,
+    so whole pipelines can be re-run offline.
+    """
+
+    def __init__(
+        self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, replay=False
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+        if not replay:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        model,
+        prompt,
+        temperature,
+        top_p,
+        frequency_penalty,
+        presence_penalty,
+        sample_idx=0
+    ):
+        payload = json.dumps(
+            [
+                model,
+                prompt,
+                temperature,
+                top_p,
+                frequency_penalty,
+                presence_penalty,
+                sample_idx,
+            ],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            if self.replay:
+                raise KeyError(f"Response not in cache (replay mode): {key}")
+            return None
+
+        self.hits += 1
+        if not self.replay:
+            os.utime(path)
+
+        return entry["response"]
+
+    def put(self, key, response):
+        if self.replay:
+            return
+
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so that concurrent readers
+        # never see a partially written entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "response": response}, f)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        if self._size is not None:
+            self._size += os.path.getsize(path) - old_size
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append(
+                    (stat.st_mtime, stat.st_size, os.path.join(root, name))
+                )
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into
+        `max_bytes`. The directory is only scanned when the running size
+        estimate exceeds the limit.
+        """
+        if self.replay:
+            return
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        if self._size <= self.max_bytes:
+            return
+
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
@@ -6,8 +6,45 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Point this at a local OpenAI-compatible server to run without the real API
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 DEFAULT_MODEL = "gpt-4o"
 
+# Maximum number of requests in flight when prompts are dispatched async
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 8))
+
+# Rate limits enforced client-side (see generation/scheduler.py)
+REQUESTS_PER_MINUTE = int(os.getenv("REQUESTS_PER_MINUTE", 500))
+TOKENS_PER_MINUTE = int(os.getenv("TOKENS_PER_MINUTE", 30000))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 6))
+
+# Context window and maximum output tokens per model
+MODEL_LIMITS = {
+    "gpt-4o": {"context": 128000, "output": 16384},
+    "gpt-4o-mini": {"context": 128000, "output": 16384},
+}
+
+# USD per 1M input and output tokens
+MODEL_PRICES = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+}
+
+# Rough number of output tokens per generated batch, i.e., one set of
+# numbered sentences including its header line
+TOKENS_PER_BATCH = {
+    "batch": 110,
+    "slog-rec_pp": 30,
+}
+
+# Default upper bound on the batches per prompt chosen by the budget
+# planner, as long responses are more likely to drift from the prompt
+MAX_BATCHES = int(os.getenv("MAX_BATCHES", 20))
+
+# On-disk response cache (see generation/cache.py)
+CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", ".cache/responses")
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 512 * 1024**2))
+
 """
 Example of the type of prompts this repo is based on:
 
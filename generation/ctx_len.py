@@ -1,7 +1,8 @@
+from functools import lru_cache
+
 import tiktoken
 
 model = "gpt-4o"
-encoding = tiktoken.encoding_for_model(model)
 
 prompt = """
 You are an expert linguist. I would like you to look at the following grammar in EBNF format:
@@ -289,19 +290,48 @@ Output just the sentences without anything extra.
 """
 
 
-def count_tokens(messages, model="gpt-4o-mini"):
-    encoding = tiktoken.encoding_for_model(model)
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Load the tokenizer of a model once and reuse it afterwards. Returns
+    None if it cannot be loaded, e.g. because its encoding has to be
+    downloaded while offline.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(
+            f"Could not load the tokenizer of {model} ({e}), "
+            f"approximating token counts"
+        )
+        return None
+
+
+def count_tokens(messages, model="gpt-4o-mini", approximate=False):
+    """
+    Number of prompt tokens of the messages, or about a quarter of their
+    characters with `approximate` or if the tokenizer is unavailable.
+    """
+    encoding = None if approximate else get_encoding(model)
     num_tokens = 0
     for message in messages:
         # Each message is formatted internally with extra tokens
         num_tokens += 4  # base cost per message (role + metadata)
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            if encoding is None:
+                num_tokens += len(value) // 4
+            else:
+                num_tokens += len(encoding.encode(value))
     num_tokens += 2  # every reply is primed with <|start|>assistant
     return num_tokens
 
 
-messages = [
-    {"role": "user", "content": prompt}
-]
-print(count_tokens(messages, model))
+def main():
+    messages = [
+        {"role": "user", "content": prompt}
+    ]
+    print(count_tokens(messages, model))
+
+
+if __name__ == "__main__":
+    main()
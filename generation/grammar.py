@@ -0,0 +1,92 @@
+import os
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+
+
+class Grammar:
+    """
+    Immutable, pre-parsed view of an EBNF grammar as written by
+    `grammars/irtg2ebnf.py`.
+
+    The file is split into the lexicon section (everything before the
+    first `S : ` rule) and the rules section. The lexicon is kept both
+    line by line, so prompts can be reassembled exactly, and as read-only
+    word arrays per terminal category plus a set of all its words.
+    """
+
+    def __init__(self, path, lexicon_lines, rules_lines):
+        self.path = path
+        self.lexicon_lines = tuple(lexicon_lines)
+        self.rules = "".join(rules_lines)
+
+        entries = []
+        categories = {}
+        for line in self.lexicon_lines:
+            if ":" not in line:
+                entries.append((None, None))
+                continue
+
+            lhs, rhs = line.split(":", 1)
+            words = np.array([w.strip() for w in rhs.split("|")])
+            words.flags.writeable = False
+            entries.append((lhs.strip(), words))
+            categories[lhs.strip()] = words
+
+        self.lexicon_entries = tuple(entries)
+        self.categories = MappingProxyType(categories)
+        self.lexicon = frozenset(
+            word
+            for words in categories.values()
+            for alternative in words
+            for word in alternative.split()
+        )
+
+        productions = {}
+        for line in rules_lines:
+            if ":" not in line:
+                continue
+            lhs, rhs = line.split(":", 1)
+            alternatives = tuple(
+                tuple(alternative.split()) for alternative in rhs.split("|")
+            )
+            productions[lhs.strip()] = (
+                productions.get(lhs.strip(), ()) + alternatives
+            )
+        self.productions = MappingProxyType(productions)
+
+
+def get_ebnf_path(grammar_path):
+    if grammar_path.endswith(".irtg"):
+        grammar_path = grammar_path.replace(".irtg", ".ebnf")
+    return grammar_path
+
+
+@lru_cache(maxsize=32)
+def _load_grammar(grammar_path, mtime):
+    lexicon_lines = []
+    rules_lines = []
+    rules_section = False
+
+    with open(grammar_path, "r") as f:
+        for line in f:
+            if not rules_section and line.startswith("S : "):
+                rules_section = True
+
+            if rules_section:
+                rules_lines.append(line)
+            else:
+                lexicon_lines.append(line)
+
+    return Grammar(grammar_path, lexicon_lines, rules_lines)
+
+
+def load_grammar(grammar_path):
+    """
+    Load the EBNF version of a grammar, parsing each file only once for
+    as long as it is not modified.
+    """
+    grammar_path = os.path.abspath(get_ebnf_path(grammar_path))
+    mtime = os.stat(grammar_path).st_mtime_ns
+    return _load_grammar(grammar_path, mtime)
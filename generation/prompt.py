@@ -1,5 +1,7 @@
 import random
 
+from generation.grammar import load_grammar
+
 
 subsample_terminals = [
     "N_common_animate_dobj ",
@@ -38,44 +40,42 @@ subsample_terminals = [
 ]
 
 
-def read_grammar(grammar_path, k):
-    if grammar_path.endswith(".irtg"):
-        grammar_path = grammar_path.replace(".irtg", ".ebnf")
+subsample_categories = frozenset(t.strip() for t in subsample_terminals)
+
+
+def read_grammar(grammar_path, k, subsample=None):
+    """
+    Return the rules and the lexicon of a grammar for a prompt, where the
+    terminal categories are subsampled to `k` words each. The words can
+    also be given per category through `subsample` (see
+    `generation.sampler.LexiconSampler`) instead of being drawn here.
+    """
+    grammar = load_grammar(grammar_path)
 
-    rules = []
     lexicon = []
-    rules_section = False
-
-    with open(grammar_path, "r") as f:
-        for line in f:
-            if not rules_section and line.startswith("S : "):
-                rules_section = True
-                rules.append(line)
-            elif rules_section:
-                rules.append(line)
+    for line, (category, words) in zip(
+        grammar.lexicon_lines, grammar.lexicon_entries
+    ):
+        if k and category in subsample_categories:
+            if subsample is not None:
+                words_cur = subsample[category]
             else:
-                if k and line.startswith(tuple(subsample_terminals)):
-                    words = line.split(":")
-                    assert len(words) == 2
+                k_curr = max(0, min(k, len(words)))
+                words_cur = random.sample(words.tolist(), k_curr)
 
-                    words = [w.strip() for w in words[-1].split("|")]
-                    k_curr = max(0, min(k, len(words)))
-                    subsample = random.sample(words, k_curr)
-
-                    line_subsampled = (
-                        line.split(":")[0]
-                        + ": "
-                        + " | ".join(subsample) + "\n"
-                    )
+            line_subsampled = (
+                line.split(":")[0]
+                + ": "
+                + " | ".join(words_cur) + "\n"
+            )
 
-                    lexicon.append(line_subsampled)
-                else:
-                    lexicon.append(line)
+            lexicon.append(line_subsampled)
+        else:
+            lexicon.append(line)
 
-    rules = "".join(rules)
     lexicon = "".join(lexicon)
 
-    return rules, lexicon
+    return grammar.rules, lexicon
 
 
 def get_constraints(dataset_type, n_batches):
@@ -329,10 +329,11 @@ def prompt_from_grammar(
     n_batches,
     k=None,
     rec_depth=None,
+    subsample=None,
 ):
     derivations = get_derivations(dataset_type, rec_depth=rec_depth)
 
-    rules, lexicon = read_grammar(grammar_path, k)
+    rules, lexicon = read_grammar(grammar_path, k, subsample=subsample)
     constraints = get_constraints(dataset_type, n_batches)
 
     if dataset_type == "batch":
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+from generation.grammar import load_grammar
+from generation.prompt import subsample_categories, prompt_from_grammar
+
+
+class LexiconSampler:
+    """
+    Seeded sampler for the lexicon subsamples of many prompts at once.
+
+    All subsampled terminal categories are padded into one matrix, so the
+    subsamples for every category and every prompt are drawn in a single
+    vectorised pass: each word gets a random Gumbel key (plus its log
+    weight) and the `k` largest keys per category are kept, which is
+    sampling without replacement. Without `zipf_a` all words are equally
+    likely; otherwise the word at rank r is weighted by r^-zipf_a, like
+    the Zipfian vocabulary in `grammars/cogs-preprocess.py`.
+
+    Every call to `draw` (one per loop of the pipeline) uses its own
+    random stream, seeded with the seed and the number of the draw, so
+    the prompts of a loop do not depend on how many prompts the earlier
+    loops drew. This keeps re-runs with the same seed in the response
+    cache even when the number of prompts per loop changes.
+    """
+
+    def __init__(self, grammar_path, k, seed=None, zipf_a=None):
+        self.grammar = load_grammar(grammar_path)
+        self.k = k
+        self.seed = (
+            seed if seed is not None else np.random.SeedSequence().entropy
+        )
+        self.zipf_a = zipf_a
+        self.n_draws = 0
+
+        self.categories = [
+            category for category in self.grammar.categories
+            if category in subsample_categories
+        ]
+        self.sizes = np.array([
+            len(self.grammar.categories[category])
+            for category in self.categories
+        ])
+
+        max_size = self.sizes.max()
+        ranks = np.arange(1, max_size + 1)
+        if zipf_a is None:
+            log_weights = np.zeros(max_size)
+        else:
+            log_weights = -zipf_a * np.log(ranks)
+
+        # Padding beyond the size of a category can never be drawn
+        self.log_weights = np.where(
+            ranks[None, :] <= self.sizes[:, None],
+            log_weights[None, :],
+            -np.inf
+        )
+
+    def draw(self, n_prompts):
+        """
+        Draw subsample indices for `n_prompts` prompts. Returns an array of
+        shape (n_prompts, n_categories, k) where categories with fewer than
+        `k` words are padded with -1.
+        """
+        k = min(self.k, self.log_weights.shape[1])
+        rng = np.random.default_rng([self.seed, self.n_draws])
+        self.n_draws += 1
+        keys = self.log_weights + rng.gumbel(
+            size=(n_prompts,) + self.log_weights.shape
+        )
+        indices = np.argsort(-keys, axis=-1)[..., :k]
+        indices[indices >= self.sizes[None, :, None]] = -1
+        return indices.astype(np.int16)
+
+    def get_subsample(self, indices):
+        return get_subsample(self.grammar, self.categories, indices)
+
+
+def get_subsample(grammar, categories, indices):
+    """Map the indices of one prompt to the words of each category."""
+    return {
+        category: grammar.categories[category][idx[idx >= 0]].tolist()
+        for category, idx in zip(categories, indices)
+    }
+
+
+def write_manifest(
+    manifest_path, sampler, indices, dataset_type, n_batches, rec_depths
+):
+    """
+    Save the seed and the chosen subsample indices of every prompt of a
+    run, which is enough to regenerate any of its prompts.
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    np.savez_compressed(
+        manifest_path,
+        grammar=np.array(sampler.grammar.path),
+        seed=np.array(str(sampler.seed)),
+        k=np.array(sampler.k),
+        zipf_a=np.array(
+            np.nan if sampler.zipf_a is None else sampler.zipf_a
+        ),
+        categories=np.array(sampler.categories),
+        dataset_type=np.array(dataset_type),
+        n_batches=np.array(n_batches),
+        rec_depths=np.array([
+            -1 if depth is None else depth for depth in rec_depths
+        ]),
+        indices=indices,
+    )
+
+
+def prompt_from_manifest(manifest_path, prompt_idx):
+    """Regenerate the prompt at position `prompt_idx` of a manifest."""
+    with np.load(manifest_path) as manifest:
+        grammar = load_grammar(str(manifest["grammar"]))
+        indices = manifest["indices"][prompt_idx]
+        rec_depth = int(manifest["rec_depths"][prompt_idx])
+        subsample = get_subsample(
+            grammar, manifest["categories"].tolist(), indices
+        )
+
+        return prompt_from_grammar(
+            str(manifest["dataset_type"]),
+            grammar.path,
+            n_batches=int(manifest["n_batches"]),
+            k=int(manifest["k"]),
+            rec_depth=None if rec_depth < 0 else rec_depth,
+            subsample=subsample,
+        )
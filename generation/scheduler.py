@@ -0,0 +1,196 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+import openai
+
+from generation.config import (
+    REQUESTS_PER_MINUTE,
+    TOKENS_PER_MINUTE,
+    MAX_RETRIES,
+)
+
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class RequestScheduler:
+    """
+    Client-side scheduler for API requests.
+
+    Requests wait until both the requests-per-minute and the
+    tokens-per-minute budget of the sliding one-minute window allow them,
+    so bursts are queued instead of running into 429s. Rate-limit and
+    transient errors are retried with exponential, jittered backoff (or
+    the server's `retry-after` hint). Throughput counters are available
+    through `get_stats`.
+
+    The scheduler can be shared between threads and between coroutines
+    of the same process. To bound the number of requests in flight across
+    processes, pass a shared semaphore (e.g. a
+    `multiprocessing.BoundedSemaphore`) as `limiter`.
+    """
+
+    def __init__(
+        self,
+        rpm=REQUESTS_PER_MINUTE,
+        tpm=TOKENS_PER_MINUTE,
+        max_retries=MAX_RETRIES,
+        backoff=1.0,
+        max_backoff=60.0,
+        window=60.0,
+        limiter=None
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.window = window
+        self.limiter = limiter
+
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self._tokens = deque()
+        self._token_sum = 0
+
+        self.n_requests = 0
+        self.n_retries = 0
+        self.n_errors = 0
+        self.n_tokens = 0
+        self.start_time = time.monotonic()
+
+    def _prune(self, now):
+        while self._requests and now - self._requests[0] >= self.window:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] >= self.window:
+            self._token_sum -= self._tokens.popleft()[1]
+
+    def _reserve(self, n_tokens):
+        """
+        Reserve budget for one request of `n_tokens` tokens. Returns 0 if
+        the request may be sent now, otherwise the time to wait before
+        trying again.
+        """
+        # A single request larger than the whole token budget can never
+        # fit, so it only has to wait for an otherwise empty window
+        n_tokens_budget = min(n_tokens, self.tpm)
+
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+
+            wait = 0.
+            if len(self._requests) >= self.rpm:
+                wait = max(wait, self._requests[0] + self.window - now)
+            if self._token_sum + n_tokens_budget > self.tpm:
+                # Wait until enough tokens have left the window
+                excess = self._token_sum + n_tokens_budget - self.tpm
+                for timestamp, n in self._tokens:
+                    excess -= n
+                    if excess <= 0:
+                        wait = max(wait, timestamp + self.window - now)
+                        break
+
+            if wait > 0:
+                return wait
+
+            self._requests.append(now)
+            self._tokens.append((now, n_tokens_budget))
+            self._token_sum += n_tokens_budget
+            self.n_requests += 1
+            self.n_tokens += n_tokens
+            return 0.
+
+    def acquire(self, n_tokens=0):
+        while (wait := self._reserve(n_tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, n_tokens=0):
+        while (wait := self._reserve(n_tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def get_backoff(self, attempt, error=None):
+        """Delay before retry number `attempt` (starting at 0)."""
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after_ms = response.headers.get("retry-after-ms")
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after_ms is not None:
+                    return float(retry_after_ms) / 1000
+                if retry_after is not None:
+                    return float(retry_after)
+            except ValueError:
+                pass
+
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _on_error(self, attempt, error):
+        if attempt >= self.max_retries:
+            with self._lock:
+                self.n_errors += 1
+            raise error
+
+        with self._lock:
+            self.n_retries += 1
+        return self.get_backoff(attempt, error)
+
+    def call(self, fn, n_tokens=0):
+        """Call `fn` within the rate limits, retrying transient errors."""
+        attempt = 0
+        while True:
+            self.acquire(n_tokens)
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                delay = self._on_error(attempt, e)
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release()
+
+            # Back off without holding a slot of the limiter
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, fn, n_tokens=0):
+        """Async counterpart of `call`, where `fn` returns an awaitable."""
+        attempt = 0
+        while True:
+            await self.acquire_async(n_tokens)
+            if self.limiter is not None:
+                # The limiter may be a blocking process-level semaphore
+                await asyncio.to_thread(self.limiter.acquire)
+            try:
+                return await fn()
+            except RETRYABLE_ERRORS as e:
+                delay = self._on_error(attempt, e)
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self.start_time
+        minutes = max(elapsed, 1e-9) / 60
+        return {
+            "n_requests": self.n_requests,
+            "n_retries": self.n_retries,
+            "n_errors": self.n_errors,
+            "n_tokens": self.n_tokens,
+            "elapsed": elapsed,
+            "requests_per_min": self.n_requests / minutes,
+            "tokens_per_min": self.n_tokens / minutes,
+        }
@@ -1,11 +1,20 @@
-from openai import OpenAI
+import asyncio
+from openai import OpenAI, AsyncOpenAI
 
 from generation.config import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     DEFAULT_MODEL,
+    MAX_CONCURRENCY,
 )
+from generation.ctx_len import count_tokens
+from generation.scheduler import RequestScheduler
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Retries are handled by the scheduler rather than by the client
+client = OpenAI(
+    api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0
+)
+default_scheduler = RequestScheduler()
 
 
 def gpt4_response(
@@ -14,23 +23,182 @@ def gpt4_response(
     temperature=1.0,
     top_p=1.0,
     frequency_penalty=0.5,
-    presence_penalty=0.0
+    presence_penalty=0.0,
+    sample_idx=0,
+    cache=None,
+    scheduler=None
+):
+    if cache is not None:
+        key = cache.make_key(
+            model,
+            prompt,
+            temperature,
+            top_p,
+            frequency_penalty,
+            presence_penalty,
+            sample_idx
+        )
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+    messages = [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+    if scheduler is None:
+        scheduler = default_scheduler
+
+    chat_completion = scheduler.call(
+        lambda: client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+        ),
+        n_tokens=count_tokens(messages, model)
+    )
+
+    response = chat_completion.choices[0].message.content
+    if cache is not None:
+        cache.put(key, response)
+
+    return response
+
+
+def gpt4_response_stream(
+    prompt,
+    model,
+    temperature=1.0,
+    top_p=1.0,
+    frequency_penalty=0.5,
+    presence_penalty=0.0,
+    sample_idx=0,
+    cache=None,
+    scheduler=None
 ):
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-        model=model,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
+    """
+    Streaming variant of `gpt4_response` that yields the lines of the
+    response (without line breaks) as soon as each one is complete.
+    """
+    if cache is not None:
+        key = cache.make_key(
+            model,
+            prompt,
+            temperature,
+            top_p,
+            frequency_penalty,
+            presence_penalty,
+            sample_idx
+        )
+        response = cache.get(key)
+        if response is not None:
+            yield from response.split("\n")
+            return
+
+    messages = [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+    if scheduler is None:
+        scheduler = default_scheduler
+
+    stream = scheduler.call(
+        lambda: client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+            stream=True,
+        ),
+        n_tokens=count_tokens(messages, model)
     )
 
-    return chat_completion.choices[0].message.content
+    chunks = []
+    buffer = ""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+
+        chunks.append(delta)
+        buffer += delta
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+
+    yield buffer
+
+    if cache is not None:
+        cache.put(key, "".join(chunks))
+
+
+async def gpt4_response_async(
+    client,
+    prompt,
+    model,
+    temperature=1.0,
+    top_p=1.0,
+    frequency_penalty=0.5,
+    presence_penalty=0.0,
+    sample_idx=0,
+    cache=None,
+    scheduler=None
+):
+    """
+    Async counterpart of `gpt4_response` using the given `AsyncOpenAI`
+    client. If a `ResponseCache` is given, the request is looked up there
+    first.
+    """
+    if cache is not None:
+        key = cache.make_key(
+            model,
+            prompt,
+            temperature,
+            top_p,
+            frequency_penalty,
+            presence_penalty,
+            sample_idx
+        )
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+    messages = [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+    if scheduler is None:
+        scheduler = default_scheduler
+
+    chat_completion = await scheduler.call_async(
+        lambda: client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+        ),
+        n_tokens=count_tokens(messages, model)
+    )
+
+    response = chat_completion.choices[0].message.content
+    if cache is not None:
+        cache.put(key, response)
+
+    return response
 
 
 def test_pipeline(
@@ -41,12 +209,21 @@ def test_pipeline(
     number="singular",
     tense="present",
     category="relatives",
+    sample_idx=0,
+    cache=None,
+    scheduler=None,
+    on_line=None,
     verbose=False
 ):
     """
     Test the pipeline with a single combination of parameters.
     Prints the generated text directly to terminal.
 
+    If `on_line` is given, the response is streamed and `on_line` is
+    called with every line as soon as it is complete. All requests go
+    through a `RequestScheduler` (the module's default one if none is
+    given), which enforces rate limits and retries transient errors.
+
     Args:
         theme (str): Theme key from themes dictionary
         number (str): Number key from numbers dictionary
@@ -60,14 +237,34 @@ def test_pipeline(
         print(prompt)
         print("-" * 50)
 
-    response = gpt4_response(
-        prompt=prompt,
-        model=DEFAULT_MODEL,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=0.1,
-        presence_penalty=0.
-    )
+    if on_line is not None:
+        lines = []
+        for line in gpt4_response_stream(
+            prompt=prompt,
+            model=DEFAULT_MODEL,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=0.1,
+            presence_penalty=0.,
+            sample_idx=sample_idx,
+            cache=cache,
+            scheduler=scheduler
+        ):
+            on_line(line)
+            lines.append(line)
+        response = "\n".join(lines)
+    else:
+        response = gpt4_response(
+            prompt=prompt,
+            model=DEFAULT_MODEL,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=0.1,
+            presence_penalty=0.,
+            sample_idx=sample_idx,
+            cache=cache,
+            scheduler=scheduler
+        )
 
     if verbose:
         print("\nGenerated response:")
@@ -78,6 +275,63 @@ def test_pipeline(
     return response
 
 
+async def test_pipeline_async(
+    prompts,
+    temperature=1.0,
+    top_p=1.0,
+    concurrency=MAX_CONCURRENCY,
+    cache=None,
+    scheduler=None,
+    verbose=False
+):
+    """
+    Send all prompts at once, with at most `concurrency` requests in
+    flight at any time. The responses are returned in the same order as
+    the prompts, so they can be concatenated exactly like the responses
+    of sequential `test_pipeline` calls. The position of each prompt is
+    used as its sample index for the response cache.
+
+    The async client is created and closed here, because its connections
+    are bound to the event loop, and every `asyncio.run` starts a new one.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def dispatch(client, sample_idx, prompt):
+        async with semaphore:
+            return await gpt4_response_async(
+                client,
+                prompt=prompt,
+                model=DEFAULT_MODEL,
+                temperature=temperature,
+                top_p=top_p,
+                frequency_penalty=0.1,
+                presence_penalty=0.,
+                sample_idx=sample_idx,
+                cache=cache,
+                scheduler=scheduler
+            )
+
+    async with AsyncOpenAI(
+        api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0
+    ) as client:
+        responses = await asyncio.gather(
+            *(dispatch(client, i, p) for i, p in enumerate(prompts))
+        )
+
+    if verbose:
+        for prompt, response in zip(prompts, responses):
+            print("Prompt:")
+            print("-" * 50)
+            print(prompt)
+            print("-" * 50)
+            print("\nGenerated response:")
+            print("-" * 50)
+            print(response)
+            print("-" * 50)
+
+    return responses
+
+
 def get_structure(number: int, variation: str, category: str) -> str:
     """Get structure type based on number and variation."""
     # Determine sentence type from file name
@@ -0,0 +1,600 @@
+import argparse
+import math
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+
+from alto_worker import BATCH_TIMEOUT, SENTENCE_TIMEOUT
+from utils import null_lf, timeout_lf
+
+
+# Memory budget of a parse, as the number of chart items (passive states
+# plus partial rules over all spans)
+MAX_CHART_ITEMS = int(os.getenv("MAX_CHART_ITEMS", 2_000_000))
+
+rule_pattern = re.compile(
+    r"^(?P<lhs>[^\s!]+)(?P<final>!?)\s*->\s*(?P<label>[^\s(\[]+)\s*"
+    r"(?:\((?P<children>[^)]*)\))?\s*(?:\[(?P<weight>[^\]]*)\])?\s*$"
+)
+interpretation_pattern = re.compile(
+    r"^\s*\[(?P<name>\w+)\]\s*(?P<term>.+?)\s*$"
+)
+term_token_pattern = re.compile(r"\s*(\(|\)|,|'[^']*'|\"[^\"]*\"|[^\s(),]+)")
+control_pattern = re.compile(r"^(?P<label>[^\[]+)\[(?P<spec>[^\]]*)\]$")
+placeholder_pattern = re.compile(r"^(?P<edge>[^<]+)<(?P<placeholder>[^>]+)>$")
+
+
+def parse_term(term):
+    """
+    Parse an IRTG term like `pre_det(?2, ?1)` into nested tuples: ("var",
+    k) for the k-th child (from 0), ("const", name) for constants and
+    ("op", name, args) for operations.
+    """
+    tokens = [token.strip("'\"") if token[0] in "'\"" else token
+              for token in term_token_pattern.findall(term)]
+    pos = 0
+
+    def parse():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        if pos < len(tokens) and tokens[pos] == "(":
+            pos += 1
+            args = [parse()]
+            while tokens[pos] == ",":
+                pos += 1
+                args.append(parse())
+            assert tokens[pos] == ")", f"Malformed term: {term}"
+            pos += 1
+            return ("op", token, tuple(args))
+        if token.startswith("?"):
+            return ("var", int(token[1:]) - 1)
+        return ("const", token)
+
+    parsed = parse()
+    assert pos == len(tokens), f"Malformed term: {term}"
+    return parsed
+
+
+def get_yield(term):
+    """
+    Flatten an English StringAlgebra term into its sequence of child
+    indices and words, as `*` is concatenation.
+    """
+    if term[0] == "op":
+        assert term[1] == "*", f"Unsupported string operation: {term[1]}"
+        return tuple(item for arg in term[2] for item in get_yield(arg))
+    if term[0] == "var":
+        return (term[1],)
+    return tuple(term[1].split())
+
+
+class Rule:
+    def __init__(
+        self, idx, lhs, label, children, weight, english, semantics
+    ):
+        self.idx = idx
+        self.lhs = lhs
+        self.label = label
+        self.children = children
+        self.weight = weight
+        self.english = english
+        self.semantics = semantics
+
+        # Symbols in string order: (True, word) or (False, nonterminal),
+        # plus the child index of every nonterminal in that order
+        self.symbols = tuple(
+            (False, children[item]) if isinstance(item, int)
+            else (True, item)
+            for item in english
+        )
+        self.child_order = tuple(
+            item for item in english if isinstance(item, int)
+        )
+        if sorted(self.child_order) != list(range(len(children))):
+            raise ValueError(
+                f"Rule {label} must use each child once in its string"
+            )
+
+    @property
+    def signature(self):
+        """
+        What the rule does, independent of its label and weight. Labels are
+        not unique across grammars (e.g. `r1792` in the combined grammars),
+        so rules of different grammars are compared by their signature.
+        """
+        return (self.lhs, self.children, self.symbols, self.semantics)
+
+
+class ParseBudgetExceeded(Exception):
+    pass
+
+
+class IrtgGrammar:
+    """
+    Pure-Python parser for the IRTGs in `grammars/`, i.e. an `english`
+    StringAlgebra interpretation and a `semantics` OrderedFeatureTreeAlgebra
+    interpretation, as an alternative to Alto.
+
+    The grammar is compiled once into rules indexed by their first
+    symbol. Sentences are parsed with a bottom-up Viterbi chart (CKY over
+    dotted rules), and the semantics of the best derivation is rendered
+    in the varfree COGS format of Alto's `cogs` output codec.
+    """
+
+    def __init__(self, path, rules, final_states):
+        self.path = path
+        self.rules = tuple(rules)
+        self.final_states = frozenset(final_states)
+
+        self.lexical = {}
+        self.unary = {}
+        self.by_first_word = {}
+        self.by_first_state = {}
+        for rule in self.rules:
+            first_terminal, first = rule.symbols[0]
+            if len(rule.symbols) == 1:
+                index = self.lexical if first_terminal else self.unary
+            elif first_terminal:
+                index = self.by_first_word
+            else:
+                index = self.by_first_state
+            index.setdefault(first, []).append(rule)
+
+    def _add_passive(self, cell, state, score, rule, children):
+        if state not in cell or score > cell[state][0]:
+            cell[state] = (score, rule, children)
+            return True
+        return False
+
+    def _close_unary(self, cell):
+        agenda = list(cell)
+        while agenda:
+            state = agenda.pop()
+            score, _, _ = cell[state]
+            for rule in self.unary.get(state, ()):
+                if self._add_passive(
+                    cell, rule.lhs, score * rule.weight, rule, (state,)
+                ):
+                    agenda.append(rule.lhs)
+
+    def chart(self, tokens, deadline=None, max_items=None):
+        """
+        Fill the Viterbi chart of a tokenised sentence. `passive[i, j]`
+        maps each state to its best (score, rule, child states) over the
+        span, `active[i, j]` does the same for partially matched rules.
+
+        Raises `ParseBudgetExceeded` once the `time.monotonic()` deadline
+        has passed or the chart holds more than `max_items` items.
+        """
+        n = len(tokens)
+        passive = {}
+        active = {}
+        n_items = 0
+
+        for length in range(1, n + 1):
+            for i in range(0, n - length + 1):
+                j = i + length
+                cell = {}
+                arcs = {}
+
+                # Extend the partial rules of (i, m) by a symbol on (m, j)
+                for m in range(i + 1, j):
+                    right = passive.get((m, j), {})
+                    for (rule, dot), (score, states) in active.get(
+                        (i, m), {}
+                    ).items():
+                        terminal, symbol = rule.symbols[dot]
+                        if terminal:
+                            if j != m + 1 or tokens[m] != symbol:
+                                continue
+                            state, child_score = None, 1.
+                        elif symbol in right:
+                            state, child_score = symbol, right[symbol][0]
+                        else:
+                            continue
+
+                        key = (rule, dot + 1)
+                        score *= child_score
+                        if key not in arcs or score > arcs[key][0]:
+                            arcs[key] = (
+                                score,
+                                states + ((m, j, state),)
+                            )
+
+                if length == 1:
+                    for rule in self.lexical.get(tokens[i], ()):
+                        self._add_passive(
+                            cell, rule.lhs, rule.weight, rule, ()
+                        )
+
+                for (rule, dot), (score, states) in list(arcs.items()):
+                    if dot == len(rule.symbols):
+                        del arcs[(rule, dot)]
+                        self._add_passive(
+                            cell, rule.lhs, score * rule.weight, rule, states
+                        )
+
+                self._close_unary(cell)
+
+                # Start the rules whose first symbol covers (i, j)
+                for state, (score, _, _) in cell.items():
+                    for rule in self.by_first_state.get(state, ()):
+                        key = (rule, 1)
+                        if key not in arcs or score > arcs[key][0]:
+                            arcs[key] = (score, ((i, j, state),))
+                if length == 1:
+                    for rule in self.by_first_word.get(tokens[i], ()):
+                        key = (rule, 1)
+                        if key not in arcs:
+                            arcs[key] = (1., ((i, j, None),))
+
+                if cell:
+                    passive[i, j] = cell
+                if arcs:
+                    active[i, j] = arcs
+
+                n_items += len(cell) + len(arcs)
+                if max_items is not None and n_items > max_items:
+                    raise ParseBudgetExceeded(
+                        f"Chart exceeded {max_items} items"
+                    )
+                if deadline is not None and time.monotonic() > deadline:
+                    raise ParseBudgetExceeded("Parse timed out")
+
+        return passive
+
+    def final_derivations(self, tokens, deadline=None, max_items=None):
+        """
+        Best derivation of every final state that covers the sentence, as
+        a map from the state to its (score, derivation).
+        """
+        if not tokens:
+            return {}
+
+        passive = self.chart(tokens, deadline=deadline, max_items=max_items)
+        top = passive.get((0, len(tokens)), {})
+        finals = [state for state in top if state in self.final_states]
+
+        def build(i, j, state):
+            _, rule, states = passive[i, j][state]
+            if len(rule.symbols) == 1 and not rule.symbols[0][0]:
+                # Unary rules stay within the span
+                children = (build(i, j, states[0]),)
+            else:
+                children = tuple(
+                    build(start, end, child)
+                    for start, end, child in states if child is not None
+                )
+
+            # Put the children from string order into rule order
+            ordered = [None] * len(rule.children)
+            for child_idx, child in zip(rule.child_order, children):
+                ordered[child_idx] = child
+            return (rule, tuple(ordered))
+
+        return {
+            state: (top[state][0], build(0, len(tokens), state))
+            for state in finals
+        }
+
+    def viterbi(self, tokens, deadline=None, max_items=None):
+        """Best derivation as nested (rule, children) tuples, or None."""
+        derivations = self.final_derivations(
+            tokens, deadline=deadline, max_items=max_items
+        )
+        if not derivations:
+            return None
+        _, derivation = max(derivations.values(), key=lambda item: item[0])
+        return derivation
+
+    def derive(self, sent, timeout=None, max_items=None):
+        """
+        Varfree LF and best derivation of a sentence. Without a parse, the
+        LF is <null> (or <timeout>, see `parse`) and the derivation None.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            derivation = self.viterbi(
+                sent.split(), deadline=deadline, max_items=max_items
+            )
+        except ParseBudgetExceeded:
+            return timeout_lf, None
+        if derivation is None:
+            return null_lf, None
+        return render(evaluate(derivation)), derivation
+
+    def parse(self, sent, timeout=None, max_items=None):
+        """
+        Varfree LF of the best parse of a sentence, or <null>. Parses that
+        take longer than `timeout` seconds or fill more than `max_items`
+        chart items are given up as <timeout>.
+        """
+        lf, _ = self.derive(sent, timeout=timeout, max_items=max_items)
+        return lf
+
+
+def get_rules(derivation):
+    """All rules used in a derivation, from the root down."""
+    rule, children = derivation
+    yield rule
+    for child in children:
+        yield from get_rules(child)
+
+
+def format_derivation(lf, derivation):
+    """
+    LF followed by a tab and the rule labels of its derivation in
+    preorder, the output of `AltoWorker.java --derivations`.
+    """
+    if derivation is None:
+        return lf + "\t"
+    return lf + "\t" + " ".join(rule.label for rule in get_rules(derivation))
+
+
+def evaluate(derivation):
+    """Evaluate the semantics of a derivation into a feature tree."""
+    rule, children = derivation
+    values = [evaluate(child) for child in children]
+    return apply_term(rule.semantics, values)
+
+
+def apply_term(term, values):
+    """
+    Feature trees are (label, ((edge, tree), ...)) tuples. `edge(t, c)`
+    appends `c` as the `edge` child of `t`, `pre_edge(t, c)` prepends it,
+    and `'edge<x>'(t, c)` appends `c` after replacing the placeholder `x`
+    in it by the head of `t`.
+    """
+    if term[0] == "var":
+        return values[term[1]]
+    if term[0] == "const":
+        return (term[1], ())
+
+    _, name, args = term
+    tree, child = (apply_term(arg, values) for arg in args)
+    label, children = tree
+
+    if name.startswith("pre_"):
+        return (label, ((name[4:], child),) + children)
+
+    match = placeholder_pattern.match(name)
+    if match:
+        name = match["edge"]
+        head = (label, tuple(c for c in children if c[0] == "det"))
+        child = replace_placeholder(child, match["placeholder"], head)
+
+    return (label, children + ((name, child),))
+
+
+def replace_placeholder(tree, placeholder, head):
+    label, children = tree
+    if label == placeholder and not children:
+        return head
+    return (label, tuple(
+        (edge, replace_placeholder(child, placeholder, head))
+        for edge, child in children
+    ))
+
+
+def resolve_control(label, children):
+    """
+    Apply control annotations like `want[agent=xcomp!agent]`: the agent
+    of `want` is also the agent of its xcomp, unless that has one already.
+    """
+    match = control_pattern.match(label)
+    if not match:
+        return label, children
+
+    children = list(children)
+    for spec in match["spec"].split(","):
+        role, path = spec.split("=")
+        edge, sub_role = path.split("!")
+        controller = next((c for e, c in children if e == role), None)
+        if controller is None:
+            continue
+        for k, (e, c) in enumerate(children):
+            if e == edge and all(e2 != sub_role for e2, _ in c[1]):
+                children[k] = (e, (c[0], c[1] + ((sub_role, controller),)))
+
+    return match["label"], tuple(children)
+
+
+def render(tree):
+    """
+    Render a feature tree as a varfree LF: definite determiners become a
+    `*` prefix, indefinite ones are dropped, and the case of a PP modifier
+    is added to its edge, as in `* poet ( nmod . on = * stool )`.
+    """
+    label, children = resolve_control(*tree)
+
+    det = None
+    args = []
+    for edge, child in children:
+        if edge == "det":
+            det = child[0]
+        elif edge != "case":
+            case = next((c[0] for e, c in child[1] if e == "case"), None)
+            if edge == "nmod" and case is not None:
+                edge = f"{edge} . {case}"
+            args.append(f"{edge} = {render(child)}")
+
+    head = f"* {label}" if det == "the" else label
+    if not args:
+        return head
+    return f"{head} ( {' , '.join(args)} )"
+
+
+@lru_cache(maxsize=32)
+def _load_irtg(grammar_path, mtime):
+    rules = []
+    final_states = set()
+    current = None
+
+    with open(grammar_path, "r") as f:
+        for line in f:
+            if not line.strip() or line.startswith("interpretation"):
+                continue
+
+            match = interpretation_pattern.match(line)
+            if match and current is not None:
+                current[match["name"]] = parse_term(match["term"])
+                continue
+
+            match = rule_pattern.match(line.strip())
+            if match is None:
+                raise ValueError(
+                    f"Cannot read line of {grammar_path}: {line}"
+                )
+
+            current = {}
+            children = tuple(
+                child.strip().rstrip("!")
+                for child in (match["children"] or "").split(",")
+                if child.strip()
+            )
+            weight = float(match["weight"]) if match["weight"] else 1.
+            rules.append((match, children, weight, current))
+            if match["final"]:
+                final_states.add(match["lhs"])
+
+    return IrtgGrammar(
+        grammar_path,
+        [
+            Rule(
+                idx,
+                match["lhs"],
+                match["label"],
+                children,
+                weight,
+                get_yield(interpretations["english"]),
+                interpretations["semantics"],
+            )
+            for idx, (match, children, weight, interpretations)
+            in enumerate(rules)
+        ],
+        final_states,
+    )
+
+
+def load_irtg(grammar_path):
+    """Load and compile an IRTG file once for as long as it is unchanged."""
+    grammar_path = os.path.abspath(grammar_path)
+    return _load_irtg(grammar_path, os.stat(grammar_path).st_mtime_ns)
+
+
+def get_python_command(grammar_path, derivations=False):
+    """
+    Command of a parser process running this module, which speaks the
+    line protocol of `alto_worker.py`.
+    """
+    return [sys.executable, os.path.abspath(__file__), grammar_path] + (
+        ["--derivations"] if derivations else []
+    )
+
+
+class PythonParserPool:
+    """
+    In-process counterpart of `alto_worker.ParserPool`, parsing with
+    `IrtgGrammar` instead of Alto processes. Each sentence gets the
+    `sentence_timeout` and `max_items` budgets; once a call to `parse`
+    has taken `batch_timeout` seconds, its remaining sentences get
+    <timeout> without being parsed. With `derivations`, the results are
+    in the format of `format_derivation`.
+    """
+
+    def __init__(
+        self,
+        sentence_timeout=SENTENCE_TIMEOUT,
+        batch_timeout=BATCH_TIMEOUT,
+        max_items=MAX_CHART_ITEMS,
+        derivations=False
+    ):
+        self.sentence_timeout = sentence_timeout
+        self.batch_timeout = batch_timeout
+        self.max_items = max_items
+        self.derivations = derivations
+        self._lock = threading.Lock()
+
+    def parse(self, grammar_path, sents, on_lf=None):
+        with self._lock:
+            grammar = load_irtg(grammar_path)
+
+        batch_deadline = time.monotonic() + (self.batch_timeout or math.inf)
+        lfs = []
+        for idx, sent in enumerate(sents):
+            remaining = batch_deadline - time.monotonic()
+            if remaining <= 0:
+                lf, derivation = timeout_lf, None
+            else:
+                lf, derivation = grammar.derive(
+                    " ".join(sent.split()),
+                    timeout=min(self.sentence_timeout or math.inf, remaining),
+                    max_items=self.max_items
+                )
+            if self.derivations:
+                lf = format_derivation(lf, derivation)
+            lfs.append(lf)
+            if on_lf is not None:
+                on_lf(idx, lf)
+        return lfs
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Parse sentences from stdin with an IRTG grammar and write one "
+            "varfree LF per line (the protocol of alto_worker.py)"
+        )
+    )
+    parser.add_argument(
+        "grammar_path",
+        type=str,
+        help="Path to the IRTG grammar file"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=SENTENCE_TIMEOUT,
+        help="Seconds after which a sentence is given up as <timeout>"
+    )
+    parser.add_argument(
+        "--max_items",
+        type=int,
+        default=MAX_CHART_ITEMS,
+        help="Chart items after which a sentence is given up as <timeout>"
+    )
+    parser.add_argument(
+        "--derivations",
+        action="store_true",
+        help="Follow each LF by a tab and its rule labels in preorder"
+    )
+    args = parser.parse_args()
+
+    grammar = load_irtg(args.grammar_path)
+    for line in sys.stdin:
+        lf, derivation = grammar.derive(
+            " ".join(line.split()),
+            timeout=args.timeout,
+            max_items=args.max_items
+        )
+        if args.derivations:
+            lf = format_derivation(lf, derivation)
+        sys.stdout.write(lf + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,44 @@
 import argparse
+import asyncio
 import json
-import numpy as np
-
-from generation.utils import test_pipeline
-from parse import format_sents, parse_sents
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from generation.utils import (
+    test_pipeline,
+    test_pipeline_async,
+    default_scheduler
+)
+from generation.cache import ResponseCache
+from generation.batch import write_batch_requests, read_batch_results
+from generation.budget import plan_budget, project_cost, print_budget
+from generation.config import MAX_BATCHES
+from parse import (
+    SentenceFormatter,
+    format_sents,
+    load_lexicon,
+    parse_sents,
+    classify_sents
+)
 from evaluate import (
-    get_non_null_lines,
+    BatchTable,
+    read_english_lines,
+    get_varfree_paths,
+    stream_parse_lines,
     get_non_rep_lines,
     get_consistent_lines,
-    get_accuracies
+    get_role_mismatches,
+    get_accuracies,
+    MetricsLog
 )
 from generation.prompt import prompt_from_grammar
+from generation.sampler import LexiconSampler, write_manifest
+from alto_worker import ParserPool, get_alto_command
+from irtg_parser import PythonParserPool
+from parse_cache import ParseCache
+from classify import TypeClassifier
 from utils import get_safe_filename, en_header, create_out_path
 from postprocess import postprocess_varfree
 
@@ -26,40 +54,65 @@ slog_datasets = [
     # for each type of dataset
 ]
 
+# Number of words subsampled per terminal category in each prompt
+lexicon_k = 30
 
-def generation_loop(
+
+def build_prompts(
     dataset_type,
     grammar_path,
     n_prompts,
     n_batches,
     depth_train=None,
     depth_gen=None,
-    verbose=False
+    sampler=None
 ):
-    responses = ""
-    for _ in range(n_prompts):
+    """
+    Build all prompts of a loop. Returns the prompts together with their
+    recursion depths and, if a `LexiconSampler` is given, the lexicon
+    subsample indices drawn for all of them at once.
+    """
+    depths = [depth_train] if depth_train is None else [depth_train, depth_gen]
+    rec_depths = [depth for _ in range(n_prompts) for depth in depths]
+
+    indices = None
+    if sampler is not None:
+        indices = sampler.draw(len(rec_depths))
+
+    prompts = []
+    for j, depth in enumerate(rec_depths):
         # Maybe also save the generated prompts?
-        for depth in [depth_train, depth_gen]:
-            prompt = prompt_from_grammar(
-                dataset_type,
-                grammar_path,
-                n_batches=n_batches,
-                k=30,
-                rec_depth=depth,
-            )
+        prompt = prompt_from_grammar(
+            dataset_type,
+            grammar_path,
+            n_batches=n_batches,
+            k=lexicon_k,
+            rec_depth=depth,
+            subsample=(
+                sampler.get_subsample(indices[j]) if sampler else None
+            ),
+        )
+        prompts.append(prompt)
+
+    return prompts, rec_depths, indices
+
+
+def save_manifest(
+    out_path, sampler, indices, dataset_type, n_batches, rec_depths
+):
+    manifest_path = create_out_path(
+        "generation/manifests", out_path, check_exists=False, ext=".npz"
+    )
+    write_manifest(
+        manifest_path, sampler, indices, dataset_type, n_batches, rec_depths
+    )
+    print("Saved prompt manifest to", manifest_path)
 
-            response = test_pipeline(
-                prompt,
-                temperature=0.5,
-                top_p=0.9,
-                verbose=verbose
-            )
-            responses += response + "\n"
 
-            if depth is None:
-                break
+def save_responses(run_name, n_prompts, responses):
+    responses = "".join(response + "\n" for response in responses)
 
-    response_path = f"generation/responses/{dataset_type}"
+    response_path = f"generation/responses/{run_name}"
 
     suffix = (
         f"-{n_prompts}-responses.txt" if n_prompts > 1 else "-response.txt"
@@ -77,7 +130,149 @@ def generation_loop(
     return response_path
 
 
-def parse_args():
+def generation_loop(
+    dataset_type,
+    grammar_path,
+    n_prompts,
+    n_batches,
+    depth_train=None,
+    depth_gen=None,
+    concurrency=1,
+    cache=None,
+    formatter=None,
+    sampler=None,
+    run_name=None,
+    verbose=False
+):
+    """
+    Prompt the model and save the concatenated responses. If a
+    `SentenceFormatter` is given, the responses are streamed into it
+    line by line while they are being generated.
+    """
+    prompts, rec_depths, indices = build_prompts(
+        dataset_type,
+        grammar_path,
+        n_prompts,
+        n_batches,
+        depth_train=depth_train,
+        depth_gen=depth_gen,
+        sampler=sampler
+    )
+
+    if concurrency > 1:
+        responses = asyncio.run(test_pipeline_async(
+            prompts,
+            temperature=0.5,
+            top_p=0.9,
+            concurrency=concurrency,
+            cache=cache,
+            verbose=verbose
+        ))
+    else:
+        responses = [
+            test_pipeline(
+                prompt,
+                temperature=0.5,
+                top_p=0.9,
+                sample_idx=i,
+                cache=cache,
+                on_line=formatter.add_line if formatter else None,
+                verbose=verbose
+            )
+            for i, prompt in enumerate(prompts)
+        ]
+
+    if verbose:
+        stats = default_scheduler.get_stats()
+        print(
+            f"Requests: {stats['n_requests']} "
+            f"({stats['n_retries']} retries, {stats['n_errors']} errors), "
+            f"{stats['requests_per_min']:.1f} requests/min, "
+            f"{stats['tokens_per_min']:.0f} tokens/min"
+        )
+
+    response_path = save_responses(
+        run_name or dataset_type, n_prompts, responses
+    )
+
+    if sampler is not None:
+        save_manifest(
+            response_path,
+            sampler,
+            indices,
+            dataset_type,
+            n_batches,
+            rec_depths
+        )
+
+    return response_path
+
+
+def write_batch_loop(
+    dataset_type,
+    grammar_path,
+    n_prompts,
+    n_batches,
+    depth_train=None,
+    depth_gen=None,
+    sampler=None,
+    run_name=None
+):
+    """
+    First phase of the offline batch mode: write every prompt as a Batch
+    API request instead of sending it.
+    """
+    prompts, rec_depths, indices = build_prompts(
+        dataset_type,
+        grammar_path,
+        n_prompts,
+        n_batches,
+        depth_train=depth_train,
+        depth_gen=depth_gen,
+        sampler=sampler
+    )
+
+    batch_path = get_safe_filename(
+        f"generation/batches/{run_name or dataset_type}"
+        f"-{n_prompts}-requests.jsonl"
+    )
+    write_batch_requests(batch_path, prompts, temperature=0.5, top_p=0.9)
+    print("Saved", len(prompts), "batch request(s) to", batch_path)
+
+    if sampler is not None:
+        save_manifest(
+            batch_path, sampler, indices, dataset_type, n_batches, rec_depths
+        )
+
+    return batch_path
+
+
+def ingest_batch_loop(run_name, results_path, n_prompts, verbose=False):
+    """
+    Second phase of the offline batch mode: turn a Batch API results file
+    into a regular response file for the rest of the pipeline.
+    """
+    responses = read_batch_results(results_path, verbose=verbose)
+    return save_responses(run_name, n_prompts, responses)
+
+
+def get_n_prompts(deficit, batch_yield, n_batches, max_prompts, margin=0.2):
+    """
+    Number of prompts needed to cover a deficit of `deficit` valid batches,
+    based on the running yield of valid batches per prompt (at most
+    `n_batches`). A safety `margin` is added on top of the estimate, and
+    the result never exceeds `max_prompts`, i.e., a full re-run.
+    """
+    if batch_yield <= 0:
+        # No valid batch so far, so there is nothing to extrapolate from
+        return max_prompts
+
+    batch_yield = min(batch_yield, n_batches)
+    n_prompts = math.ceil(deficit * (1 + margin) / batch_yield)
+    return max(1, min(n_prompts, max_prompts))
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="Execute data generation pipeline"
     )
@@ -99,7 +294,20 @@ def parse_args():
     parser.add_argument(
         "n_batches",
         type=int,
-        help="Number of batches per prompt"
+        nargs="?",
+        help=(
+            "Number of batches per prompt (if omitted, as many as fit the "
+            "model's output limit, up to --max_batches)"
+        )
+    )
+    parser.add_argument(
+        "--max_batches",
+        type=int,
+        default=MAX_BATCHES,
+        help=(
+            "Upper bound for the automatically chosen number of batches "
+            f"(default: {MAX_BATCHES})"
+        )
     )
     parser.add_argument(
         "-rt", "--rec_depth_train",
@@ -111,13 +319,149 @@ def parse_args():
         type=int,
         help="Recursion depth for generalization sentences"
     )
+    parser.add_argument(
+        "-c", "--concurrency",
+        type=int,
+        default=1,
+        help="Number of prompts to send concurrently (1 is sequential)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the lexicon subsampling of the prompts"
+    )
+    parser.add_argument(
+        "--zipf",
+        type=float,
+        help="Zipf exponent to weight the lexicon subsampling by word rank"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses and format them while they are generated"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=(
+            "Reuse and store model responses in the on-disk response cache "
+            "(only re-runs with the same --seed hit the cache)"
+        )
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help=(
+            "Only read responses from the cache, never call the API "
+            "(needs the --seed of the cached run)"
+        )
+    )
+    parser.add_argument(
+        "--yield_margin",
+        type=float,
+        default=0.2,
+        help="Safety margin on top of the estimated prompts for regeneration"
+    )
+    parser.add_argument(
+        "--batch_out",
+        action="store_true",
+        help="Only write the prompts as Batch API requests and exit"
+    )
+    parser.add_argument(
+        "--batch_in",
+        type=str,
+        help="Path to Batch API results to use instead of prompting the model"
+    )
+    parser.add_argument(
+        "-j", "--n_jobs",
+        type=int,
+        help=(
+            "Number of sentence types to parse concurrently "
+            "(one per type by default)"
+        )
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Parse sentences that the EBNF recognizer rejects as well"
+    )
+    parser.add_argument(
+        "--no_parse_cache",
+        action="store_true",
+        help="Parse every sentence instead of reusing cached parses"
+    )
+    parser.add_argument(
+        "--python_parser",
+        action="store_true",
+        help="Parse with the pure-Python IRTG parser instead of Alto"
+    )
+    parser.add_argument(
+        "--no_worker",
+        action="store_true",
+        help=(
+            "Start a new Alto process per sentence type instead of keeping "
+            "one warm parser worker per control grammar"
+        )
+    )
+    parser.add_argument(
+        "--derivations",
+        action="store_true",
+        help="Save the rule ids of every derivation to output/derivations"
+    )
+    parser.add_argument(
+        "--classify",
+        action="store_true",
+        help=(
+            "Parse once with the combined grammar and re-bucket "
+            "misnumbered sentences (batch only)"
+        )
+    )
+    parser.add_argument(
+        "--name",
+        type=str,
+        help="Name prefix of the output files (defaults to the dataset type)"
+    )
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
         help="Enable verbose output"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.batch_out and args.batch_in:
+        parser.error("Use either --batch_out or --batch_in, not both")
+
+    if args.batch_in and args.n_batches is None:
+        parser.error("Specify n_batches when ingesting batch results")
+
+    if args.replay and args.n_batches is None:
+        parser.error("Specify n_batches when replaying cached responses")
+
+    if args.replay and args.seed is None and not args.batch_in:
+        # The prompts, and so the cache keys, depend on the lexicon sample
+        parser.error("Specify the --seed of the cached run to replay it")
+
+    if args.concurrency < 1:
+        parser.error("The concurrency limit must be at least 1")
+
+    if args.python_parser and args.no_worker:
+        parser.error("--python_parser does not use Alto workers")
+
+    if args.classify and args.dataset_type != "batch":
+        parser.error("--classify only supports the batch dataset")
+
+    if args.derivations and (args.classify or args.no_worker):
+        parser.error(
+            "--derivations needs the parser workers, not --classify or "
+            "--no_worker"
+        )
+
+    if args.n_jobs is not None and args.n_jobs < 1:
+        parser.error("The number of parse jobs must be at least 1")
+
+    if args.stream and (args.concurrency > 1 or args.batch_in):
+        parser.error("--stream only works with sequential generation")
 
     if (
         "rec" in args.dataset_type and
@@ -133,16 +477,68 @@ def parse_args():
     return args
 
 
-def main():
-    args = parse_args()
+def run(args):
+    """
+    Run the whole pipeline for the parsed command line arguments and
+    return the metrics of the run.
+    """
     dataset_type = args.dataset_type
     prompt_grammar = args.grammar_path
     n_prompts = args.n_prompts
     n_batches = args.n_batches
     rec_depth_train = args.rec_depth_train
     rec_depth_gen = args.rec_depth_gen
+    concurrency = args.concurrency
+    yield_margin = args.yield_margin
+    stream = args.stream
+    run_name = args.name or dataset_type
     verbose = args.verbose
 
+    batch_results = args.batch_in
+
+    if batch_results is None:
+        # Plan the token budget before anything is sent to the model.
+        # Replays approximate the prompt tokens, so they can run offline
+        plan = plan_budget(
+            dataset_type,
+            prompt_grammar,
+            k=lexicon_k,
+            max_batches=args.max_batches,
+            rec_depth=rec_depth_gen,
+            n_batches=n_batches,
+            approximate=args.replay
+        )
+        n_batches = plan["n_batches"]
+
+        projection = project_cost(
+            plan, n_prompts, prompts_per_unit=1 if rec_depth_gen is None else 2
+        )
+        print_budget(plan, projection)
+
+    cache = None
+    if args.cache or args.replay:
+        cache = ResponseCache(replay=args.replay)
+
+    sampler = None
+    if batch_results is None:
+        sampler = LexiconSampler(
+            prompt_grammar, lexicon_k, seed=args.seed, zipf_a=args.zipf
+        )
+        print("Lexicon sampling seed:", sampler.seed)
+
+    if args.batch_out:
+        write_batch_loop(
+            dataset_type,
+            prompt_grammar,
+            n_prompts,
+            n_batches,
+            depth_train=rec_depth_train,
+            depth_gen=rec_depth_gen,
+            sampler=sampler,
+            run_name=run_name
+        )
+        return None
+
     if dataset_type == "batch":
         batch_size = 6
         control_grammars = [
@@ -181,105 +577,167 @@ def main():
 
     n_sents = n_prompts * n_batches * batch_size
 
-    metrics = {}
-
-    oov_pct_total_list = []
-    oov_pct_sent_list = []
-    accs_list = []
-    rep_accs_list = []
-    consistent_accs_list = []
-    n_loops = 0
-    metrics["dataset_type"] = dataset_type
-    metrics["n_prompts"] = n_prompts
-    metrics["n_batches"] = n_batches
-    metrics["n_sents"] = n_sents
+    # The counts of every loop are appended to the log as soon as the loop
+    # is evaluated, so they are kept even if the run fails later
+    metrics_log = MetricsLog(
+        get_safe_filename(f"data/metrics/{run_name}.jsonl"),
+        info={
+            "dataset_type": dataset_type,
+            "n_prompts": n_prompts,
+            "n_batches": n_batches,
+            "n_sents": n_sents,
+        }
+    )
     english, semantics = [], []
+
+    # The parser workers are kept warm across loops. If the run fails,
+    # they exit on their own once their stdin is closed with this process
+    if args.classify:
+        pool = None
+    elif args.python_parser:
+        pool = PythonParserPool(derivations=args.derivations)
+    elif args.no_worker:
+        pool = None
+    else:
+        pool = ParserPool(
+            get_command=partial(get_alto_command, derivations=args.derivations)
+        )
+    parse_cache = None if args.no_parse_cache else ParseCache()
+    classifier = TypeClassifier(control_grammars) if args.classify else None
+
+    # Running yield estimate of valid batches per prompt, used to only
+    # request as many prompts as are needed to cover the remaining deficit
+    n_prompts_cur = n_prompts
+    n_prompts_total = 0
+    n_valid_total = 0
     while len(semantics) != (n_batches*n_prompts):
         # Generation step
-        response_path = generation_loop(
-            dataset_type,
-            prompt_grammar,
-            n_prompts,
-            n_batches,
-            depth_train=rec_depth_train,
-            depth_gen=rec_depth_gen,
-            verbose=verbose
-        )
+        formatter = None
+        if stream:
+            formatter = SentenceFormatter(
+                dataset_type,
+                batch_size,
+                n_batches,
+                lex=load_lexicon(prompt_grammar),
+                show_oov=verbose
+            )
+
+        if batch_results is not None:
+            response_path = ingest_batch_loop(
+                run_name, batch_results, n_prompts, verbose=verbose
+            )
+        else:
+            response_path = generation_loop(
+                dataset_type,
+                prompt_grammar,
+                n_prompts_cur,
+                n_batches,
+                depth_train=rec_depth_train,
+                depth_gen=rec_depth_gen,
+                concurrency=concurrency,
+                cache=cache,
+                formatter=formatter,
+                sampler=sampler,
+                run_name=run_name,
+                verbose=verbose
+            )
 
         # Format and parse model outputs
-        format_sents(
-            dataset_type, response_path, batch_size, n_batches, verbose=verbose
-        )
+        if formatter is not None:
+            formatter.write(response_path, verbose=verbose)
+        else:
+            format_sents(
+                dataset_type,
+                response_path,
+                batch_size,
+                n_batches,
+                verbose=verbose
+            )
 
         # TODO: How to parse variable recursion depths ??
-        oov_pct_total, oov_pct_sent = parse_sents(
-            response_path,
-            prompt_grammar,
-            control_grammars,
-            batch_size,
-            verbose=verbose
-        )
+        # The sentences are parsed in the background, while the validity
+        # masks are built from the LF files as they are being written
+        english_lines = read_english_lines(response_path, batch_size)
+        n_lines = [len(lines) for lines in english_lines]
+        for varfree_path in get_varfree_paths(response_path, batch_size):
+            if os.path.exists(varfree_path):
+                os.remove(varfree_path)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if classifier is not None:
+                parsing = executor.submit(
+                    classify_sents,
+                    response_path,
+                    prompt_grammar,
+                    control_grammars,
+                    batch_size,
+                    oov_stats=formatter.get_oov_stats() if formatter else None,
+                    classifier=classifier,
+                    verbose=verbose
+                )
+            else:
+                parsing = executor.submit(
+                    parse_sents,
+                    response_path,
+                    prompt_grammar,
+                    control_grammars,
+                    batch_size,
+                    oov_stats=formatter.get_oov_stats() if formatter else None,
+                    pool=pool,
+                    cache=parse_cache,
+                    prefilter=not args.no_prefilter,
+                    n_jobs=args.n_jobs,
+                    derivations=args.derivations,
+                    verbose=verbose
+                )
+
+            non_null_lines, timeout_lines, lf_lines = stream_parse_lines(
+                response_path, batch_size, n_lines=n_lines, done=parsing.done
+            )
+            oov_counts = parsing.result()
+
+        if classifier is not None:
+            # The sentences may have moved to other types
+            english_lines = read_english_lines(response_path, batch_size)
+        table = BatchTable.from_lines(english_lines, lf_lines)
 
         # Evaluate and filter
         # TODO: Put all this in an eval block
-        oov_pct_total_list.append(oov_pct_total)
-        oov_pct_sent_list.append(oov_pct_sent)
-
-        non_null_lines = get_non_null_lines(
-            response_path, batch_size
+        get_accuracies(
+            non_null_lines, timeout_lines=timeout_lines, verbose=verbose
         )
-        accs = get_accuracies(non_null_lines, verbose=verbose)
-        accs_list.append(accs)
+        valid_lines = {"parse": non_null_lines}
+        role_mismatches = None
 
         if dataset_type == "batch":
             consistent_lines = get_consistent_lines(
-                response_path, non_null_lines, batch_size
+                table, non_null_lines, verbose=verbose
             )
-            consistent_accs = get_accuracies(consistent_lines, verbose=verbose)
-            consistent_accs_list.append(consistent_accs)
+            get_accuracies(consistent_lines, verbose=verbose)
+            role_mismatches = get_role_mismatches(table, non_null_lines)
+            valid_lines["consistent"] = consistent_lines
         else:
             consistent_lines = non_null_lines
 
-        non_rep_lines = get_non_rep_lines(
-            response_path, consistent_lines, batch_size
+        non_rep_lines = get_non_rep_lines(table, consistent_lines)
+        get_accuracies(non_rep_lines, verbose=verbose)
+        valid_lines["non_rep"] = non_rep_lines
+
+        metrics_log.add_loop(
+            valid_lines,
+            n_prompts_cur,
+            timeout_lines=timeout_lines,
+            role_mismatches=role_mismatches,
+            oov_counts=oov_counts
         )
-        rep_accs = get_accuracies(non_rep_lines, verbose=verbose)
-        rep_accs_list.append(rep_accs)
 
         # Filtering step
         valid_batches = non_rep_lines.all(axis=0)
-        en_lines = []
-        vf_lines = []
-        for i in range(0, batch_size):
-            en_lines_cur = []
-            vf_lines_cur = []
-            sent_path = create_out_path(
-                f"output/english/{i + 1}",
-                response_path,
-                check_exists=False,
-                ext=".txt"
-            )
-            varfree_path = create_out_path(
-                f"output/varfree_lf/{i + 1}",
-                response_path,
-                check_exists=False,
-                ext=".txt"
-            )
-
-            with open(sent_path, "r") as f:
-                en_lines_cur = np.array([
-                    line for line in f.readlines()
-                    if line.strip() and not line.startswith("//")
-                ], dtype=object)
-
-            with open(varfree_path, "r") as f:
-                vf_lines_cur = np.array(f.readlines(), dtype=object)
-
-            en_lines.append(en_lines_cur[valid_batches])
-            vf_lines.append(vf_lines_cur[valid_batches])
-
-        en_lines = np.array(en_lines, dtype=object).T.tolist()
-        vf_lines = np.array(vf_lines, dtype=object).T.tolist()
+        n_prompts_total += n_prompts_cur
+        n_valid_total += int(valid_batches.sum())
+        en_lines, vf_lines = table.select(valid_batches)
+        en_lines = [[line + "\n" for line in batch] for batch in en_lines]
+        vf_lines = [[lf + "\n" for lf in batch] for batch in vf_lines]
 
         if not english and not semantics:
             english = list(en_lines)
@@ -290,9 +748,23 @@ def main():
             english.extend(en_lines[:remainder])
             semantics.extend(vf_lines[:remainder])
 
-        n_loops += 1
         print("Generated", len(semantics), "/", n_batches*n_prompts)
 
+        n_prompts_cur = get_n_prompts(
+            n_batches*n_prompts - len(semantics),
+            n_valid_total / n_prompts_total,
+            n_batches,
+            n_prompts,
+            margin=yield_margin
+        )
+
+        if batch_results is not None:
+            # Offline results cannot be topped up with new generations
+            break
+
+    if pool is not None:
+        pool.close()
+
     sent_path = create_out_path(
         "data/english", response_path, check_exists=True, ext=".txt"
     )
@@ -310,15 +782,8 @@ def main():
         f.write("".join(line for batch in semantics for line in batch))
         print("Saved representations to", varfree_path)
 
-    assert (
-        len(oov_pct_total_list) == len(oov_pct_sent_list) == n_loops
-    )
-    metrics["oov_pct_total"] = oov_pct_total_list
-    metrics["oov_pct_sent"] = oov_pct_sent_list
-    metrics["accs"] = accs_list
-    metrics["consistent_accs"] = consistent_accs_list
-    metrics["rep_accs"] = rep_accs_list
-    metrics["n_loops"] = n_loops
+    metrics = metrics_log.summary()
+    metrics["metrics_log"] = metrics_log.path
 
     metrics_path = create_out_path(
         "data/metrics", response_path, check_exists=True, ext=".json"
@@ -331,6 +796,12 @@ def main():
     # Postprocessing step
     postprocess_varfree(sent_path, varfree_path, verbose=verbose)
 
+    return metrics
+
+
+def main():
+    run(parse_args())
+
 
 if __name__ == "__main__":
     main()
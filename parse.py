@@ -1,11 +1,139 @@
 import argparse
+import os
 import subprocess
-from utils import read_grammar, en_header, create_out_path
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from utils import en_header, create_out_path, null_lf, timeout_lf
+from alto_worker import (
+    ALTO_JAR,
+    ALTO_MAX_HEAP,
+    BATCH_TIMEOUT,
+    SENTENCE_TIMEOUT,
+    ParserPool,
+    get_alto_command
+)
+from classify import TypeClassifier, assign_types, get_types
+from parse_cache import ParseCache
+from irtg_parser import MAX_CHART_ITEMS, PythonParserPool, load_irtg
+from derivations import get_rule_ids, save_derivations
+from recognizer import get_recognizer
+from generation.grammar import load_grammar
 
 
 rel_prons = ["which", "who", "whom"]
 
 
+def normalize_sent(dataset_type, line, n):
+    """
+    Normalise one numbered sentence line of a model response into the
+    SLOG English representation (lowercased, relative pronouns mapped to
+    "that", no punctuation).
+    """
+    sent = line[3:]
+    sent = sent[0].lower() + sent[1:]
+    sent = " ".join([
+        w if w not in rel_prons else "that"
+        for w in sent.split(" ")
+    ])
+    sent = sent.replace(" an ", " the ")
+
+    if dataset_type == "batch" and n == 1:
+        batch_det = sent.split(" ")[0]
+        sent = batch_det + " " + " ".join(sent.split(" ")[1:])
+
+    sent = sent.replace(",", "")
+    sent = sent.strip()
+    sent = sent.rstrip(".")
+
+    return sent
+
+
+def count_oov(line, lex, words, show_oov=False):
+    """
+    Count the OOV words of a single sentence. Words that were already
+    seen in `words` are only counted once unless `show_oov` is set.
+    """
+    oov_current_sent = 0
+    for word in line.split(" "):
+        word = word.strip()
+        if not word:
+            continue
+
+        if show_oov and word not in lex:
+            print(f"Word \"{word}\" not in lexicon")
+            oov_current_sent += 1
+        elif word not in words and word not in lex:
+            oov_current_sent += 1
+        words.add(word)
+
+    return oov_current_sent
+
+
+class SentenceFormatter:
+    """
+    Incremental counterpart of `format_sents`: response lines are added
+    one at a time (e.g. while a response is still being streamed), and
+    the formatted sentences are written once the response is complete.
+
+    If a lexicon is given, the OOV counts per sentence type are tracked
+    as well, in the same format as returned by `lexical_parse`.
+    """
+
+    def __init__(
+        self, dataset_type, batch_size, n_batches, lex=None, show_oov=False
+    ):
+        self.dataset_type = dataset_type
+        self.batch_size = batch_size
+        self.n_batches = n_batches
+        self.lex = lex
+        self.show_oov = show_oov
+        self.sent_types = [[] for _ in range(batch_size)]
+        self.oov_stats = [[0, 0, 0, set()] for _ in range(batch_size)]
+
+    def add_line(self, line):
+        if not line or not line[0].isdigit():
+            return
+
+        if self.dataset_type == "batch":
+            assert 1 <= (n := int(line[0])) <= self.batch_size
+        else:
+            assert 1 <= (n := int(line[0])) <= self.n_batches
+
+        sent = normalize_sent(self.dataset_type, line, n)
+        if self.dataset_type == "batch":
+            i = n - 1
+        else:
+            i = 0 if len(self.sent_types[0]) < self.n_batches else 1
+        self.sent_types[i].append(sent)
+
+        if self.lex is not None and sent.strip():
+            stats = self.oov_stats[i]
+            oov_current_sent = count_oov(
+                sent.strip(), self.lex, stats[3], show_oov=self.show_oov
+            )
+            stats[0] += oov_current_sent
+            stats[1] += 1 if oov_current_sent != 0 else 0
+            stats[2] += 1
+
+    def get_oov_stats(self):
+        return [tuple(stats) for stats in self.oov_stats]
+
+    def write(self, response_path, verbose=False):
+        for i, sent_list in enumerate(self.sent_types):
+            content = "\n".join(sent_list)
+            sent_path = create_out_path(
+                f"output/english/{i + 1}/",
+                response_path,
+                check_exists=False,
+                ext=".txt"
+            )
+            with open(sent_path, "w") as f:
+                f.write(en_header + content + "\n")
+                if verbose:
+                    print("Saved formatted sentences to", sent_path)
+
+
 def format_sents(
         dataset_type, response_path, batch_size, n_batches, verbose=False
 ):
@@ -28,51 +156,25 @@ def format_sents(
     with open(response_path, "r") as f:
         lines = f.readlines()
 
-    sent_types = [[] for _ in range(batch_size)]
+    formatter = SentenceFormatter(dataset_type, batch_size, n_batches)
     for line in lines:
-        if not line[0].isdigit():
-            continue
+        formatter.add_line(line)
 
-        if dataset_type == "batch":
-            assert 1 <= (n := int(line[0])) <= batch_size
-        else:
-            assert 1 <= (n := int(line[0])) <= n_batches
-
-        sent = line[3:]
-        sent = sent[0].lower() + sent[1:]
-        sent = " ".join([
-            w if w not in rel_prons else "that"
-            for w in sent.split(" ")
-        ])
-        sent = sent.replace(" an ", " the ")
-
-        if dataset_type == "batch" and n == 1:
-            batch_det = sent.split(" ")[0]
-            sent = batch_det + " " + " ".join(sent.split(" ")[1:])
-
-        sent = sent.replace(",", "")
-        sent = sent.strip()
-        sent = sent.rstrip(".")
-        if dataset_type == "batch":
-            sent_types[n - 1].append(sent)
-        else:
-            if len(sent_types[0]) < n_batches:
-                sent_types[0].append(sent)
-            else:
-                sent_types[1].append(sent)
+    formatter.write(response_path, verbose=verbose)
 
-    for i, sent_list in enumerate(sent_types):
-        content = "\n".join(sent_list)
-        sent_path = create_out_path(
-            f"output/english/{i + 1}/",
-            response_path,
-            check_exists=False,
-            ext=".txt"
-        )
-        with open(sent_path, "w") as f:
-            f.write(en_header + content + "\n")
-            if verbose:
-                print("Saved formatted sentences to", sent_path)
+
+def load_lexicon(prompt_grammar):
+    """Use the base grammar as lexicon."""
+    return load_grammar(prompt_grammar).lexicon
+
+
+def read_sents(sent_path):
+    """Read the sentences of an Alto corpus file, skipping the header."""
+    with open(sent_path, "r") as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.startswith("//")
+        ]
 
 
 def lexical_parse(sent_path, lex, show_oov=False):
@@ -91,18 +193,7 @@ def lexical_parse(sent_path, lex, show_oov=False):
                 continue
 
             sent_count += 1
-            oov_current_sent = 0
-            for word in line.split(" "):
-                word = word.strip()
-                if not word:
-                    continue
-
-                if show_oov and word not in lex:
-                    print(f"Word \"{word}\" not in lexicon")
-                    oov_current_sent += 1
-                elif word not in words and word not in lex:
-                    oov_current_sent += 1
-                words.add(word)
+            oov_current_sent = count_oov(line, lex, words, show_oov=show_oov)
 
             oov_count += oov_current_sent
             oov_sents += 1 if oov_current_sent != 0 else oov_current_sent
@@ -113,11 +204,197 @@ def lexical_parse(sent_path, lex, show_oov=False):
     return oov_count, oov_sents, sent_count, words
 
 
+def alto_parse(
+    control_grammar, sents, timeout=BATCH_TIMEOUT, verbose=False
+):
+    """
+    Parse the sentences with a one-off Alto `ParsingEvaluator` process,
+    returning one LF (or <null>) per sentence. If the process takes longer
+    than `timeout` seconds, it is killed and every sentence gets <timeout>.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sent_path = os.path.join(tmp_dir, "english.txt")
+        varfree_path = os.path.join(tmp_dir, "varfree_lf.txt")
+        with open(sent_path, "w") as f:
+            f.write(en_header + "".join(sent + "\n" for sent in sents))
+
+        command = [
+            "java", f"-Xmx{ALTO_MAX_HEAP}", "-cp", ALTO_JAR,
+            "de.up.ling.irtg.script.ParsingEvaluator",
+            "-g", control_grammar,
+            "-I", "english", "-O", "semantics=cogs",
+            "-o", varfree_path,
+            "--no-derivations",
+            sent_path
+        ]
+
+        try:
+            if verbose:
+                subprocess.run(command, timeout=timeout)
+                print()
+            else:
+                subprocess.run(
+                    command, capture_output=True, text=True, timeout=timeout
+                )
+        except subprocess.TimeoutExpired:
+            print(
+                f"Parsing {len(sents)} sentences with {control_grammar} "
+                f"timed out after {timeout}s"
+            )
+            return [timeout_lf] * len(sents)
+
+        with open(varfree_path, "r") as f:
+            return [line.rstrip("\n") for line in f]
+
+
+def parse_type(
+    i,
+    response_path,
+    control_grammar,
+    lex=None,
+    oov_stats=None,
+    pool=None,
+    cache=None,
+    prefilter=False,
+    derivations=False,
+    verbose=False
+):
+    """
+    Parse the sentences of type `i + 1` with their control grammar and
+    return their OOV stats in the format of `lexical_parse`. Sentences
+    found in the parse `cache` are not parsed again. With `prefilter`,
+    sentences outside the language of the grammar's EBNF version get
+    <null> without being parsed.
+
+    With `derivations`, the `pool` must answer in the format of
+    `AltoWorker.java --derivations`, and the rule ids of every derivation
+    are saved to `output/derivations/` (see `derivations.py`). As the
+    cache only holds LFs, every sentence is parsed again in that case.
+    """
+    sent_path = create_out_path(
+        f"output/english/{i + 1}/",
+        response_path,
+        check_exists=False,
+        ext=".txt"
+    )
+
+    if oov_stats is not None:
+        stats = oov_stats[i]
+    else:
+        stats = lexical_parse(sent_path, lex, show_oov=verbose)
+
+    sents = read_sents(sent_path)
+    if cache is not None and not derivations:
+        lfs = cache.get(control_grammar, sents)
+    else:
+        lfs = [None] * len(sents)
+
+    # Only sentences without a cached LF are parsed, each of them once
+    missing = list(dict.fromkeys(
+        sent for sent, lf in zip(sents, lfs) if lf is None
+    ))
+
+    recognizer = get_recognizer(control_grammar) if prefilter else None
+    if recognizer is not None:
+        parsed = {
+            sent: null_lf for sent in missing
+            if not recognizer.accepts(sent)
+        }
+        to_parse = [sent for sent in missing if sent not in parsed]
+    else:
+        parsed = {}
+        to_parse = missing
+
+    # The LFs are written in sentence order as soon as they are known, so
+    # readers can follow the file while the rest is still being parsed
+    varfree_path = sent_path.replace("english", "varfree_lf")
+    with open(varfree_path, "w") as f:
+        n_written = 0
+
+        def write_ready():
+            nonlocal n_written
+            while n_written < len(sents):
+                lf = lfs[n_written]
+                if lf is None:
+                    lf = parsed.get(sents[n_written])
+                if lf is None:
+                    break
+                f.write(lf + "\n")
+                n_written += 1
+            f.flush()
+
+        rule_ids = {}
+        grammar = load_irtg(control_grammar) if derivations else None
+
+        def on_lf(idx, lf):
+            if derivations:
+                lf, _, labels = lf.partition("\t")
+                rule_ids[to_parse[idx]] = get_rule_ids(grammar, labels.split())
+            parsed[to_parse[idx]] = lf
+            write_ready()
+
+        write_ready()
+        if to_parse:
+            if pool is not None:
+                pool.parse(control_grammar, to_parse, on_lf=on_lf)
+            else:
+                lfs_parsed = alto_parse(
+                    control_grammar, to_parse, verbose=verbose
+                )
+                for idx, lf in enumerate(lfs_parsed):
+                    on_lf(idx, lf)
+
+    if derivations:
+        derivation_path = create_out_path(
+            f"output/derivations/{i + 1}/",
+            response_path,
+            check_exists=False,
+            ext=".npz"
+        )
+        os.makedirs(os.path.dirname(derivation_path), exist_ok=True)
+        save_derivations(
+            derivation_path,
+            control_grammar,
+            [rule_ids.get(sent) for sent in sents]
+        )
+
+    if missing:
+        # Only parser output is cached, keyed by the grammar. Prefilter
+        # rejections depend on the EBNF file, and timeouts on the machine
+        # and the budget, so both are decided again in later runs
+        cached = [sent for sent in to_parse if parsed[sent] != timeout_lf]
+        if cache is not None:
+            cache.put(
+                control_grammar, cached, [parsed[sent] for sent in cached]
+            )
+
+        lfs = [
+            parsed[sent] if lf is None else lf
+            for sent, lf in zip(sents, lfs)
+        ]
+
+    if verbose:
+        print(
+            f"Saved parses to {varfree_path} "
+            f"({len(sents) - len(missing)} / {len(sents)} from cache, "
+            f"{len(missing) - len(to_parse)} rejected by the prefilter, "
+            f"{lfs.count(timeout_lf)} timed out)"
+        )
+
+    return stats
+
+
 def parse_sents(
     response_path,
     prompt_grammar,
     control_grammars,
     batch_size,
+    oov_stats=None,
+    pool=None,
+    cache=None,
+    prefilter=False,
+    n_jobs=None,
+    derivations=False,
     verbose=False
 ):
     """
@@ -132,70 +409,75 @@ def parse_sents(
     If the parse is not valid, the corresponding line contains <null>, which
     we use to filter which sentence batches to keep as well as to compute
     an accuracy score. In addition, this function performs a lexical parse
-    on each sentence file in order to evaluate OOV percentages.
+    on each sentence file in order to evaluate OOV percentages, unless the
+    per-type `oov_stats` were already collected by a `SentenceFormatter`.
+
+    With a `ParserPool`, the sentences are sent to its warm parser workers
+    instead of starting a new Alto process for every sentence type.
+
+    With a `ParseCache`, only sentences without a cached parse under the
+    same control grammar are parsed. With `prefilter`, sentences that the
+    EBNF recognizer of the control grammar rejects are not parsed either.
+
+    The sentence types are parsed concurrently by up to `n_jobs` threads
+    (one per type by default), as they only share the read-only lexicon.
+
+    With `derivations`, the rule ids of every parse are kept as well (see
+    `parse_type`), which needs a `pool` started with derivations.
     """
     assert len(control_grammars) == batch_size
+
+    lex = None
+    if oov_stats is None:
+        lex = load_lexicon(prompt_grammar)
+
+    n_jobs = n_jobs or min(batch_size, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        stats = list(executor.map(
+            lambda i: parse_type(
+                i,
+                response_path,
+                control_grammars[i],
+                lex=lex,
+                oov_stats=oov_stats,
+                pool=pool,
+                cache=cache,
+                prefilter=prefilter,
+                derivations=derivations,
+                verbose=verbose
+            ),
+            range(batch_size)
+        ))
+
+    # Results come back in type order, so the totals are deterministic
+    return get_oov_counts(stats, verbose=verbose)
+
+
+def get_oov_counts(stats, verbose=False):
+    """
+    Total OOV counts from the OOV stats of every sentence type, in the
+    format of `lexical_parse`: the number of OOV words, of distinct words,
+    of sentences with an OOV word and of sentences.
+    """
     oov_count = 0
     oov_sents = 0
     sent_count = 0
     words = set()
 
-    if prompt_grammar.endswith(".irtg"):
-        grammar_path = prompt_grammar.replace(".irtg", ".ebnf")
-
-    # Use the base grammar as lexicon
-    lex = read_grammar(grammar_path, lex_only=True)
-
-    for i in range(0, batch_size):
-        sent_path = create_out_path(
-            f"output/english/{i + 1}/",
-            response_path,
-            check_exists=False,
-            ext=".txt"
-        )
-
-        (
-            oov_count_cur,
-            oov_sents_cur,
-            sent_count_cur,
-            words_cur
-        ) = lexical_parse(
-            sent_path,
-            lex,
-            show_oov=verbose
-        )
-
+    for (
+        oov_count_cur,
+        oov_sents_cur,
+        sent_count_cur,
+        words_cur
+    ) in stats:
         oov_count += oov_count_cur
         oov_sents += oov_sents_cur
         sent_count += sent_count_cur
         words.update(words_cur)
 
-        # Use the separate sentence grammars to parse
-        sent_grammar_path = control_grammars[i % batch_size]
-
-        varfree_path = sent_path.replace("english", "varfree_lf")
-        command = (
-            "java -cp ../alto/build/libs/alto-2.3.8-SNAPSHOT-all.jar "
-            "de.up.ling.irtg.script.ParsingEvaluator "
-            f"-g {sent_grammar_path} "
-            "-I english -O semantics=cogs "
-            f"-o {varfree_path} "
-            "--no-derivations "
-            f"{sent_path}"
-        )
-
-        if verbose:
-            subprocess.run(command, shell=True)
-            print()
-        else:
-            subprocess.run(
-                command, shell=True, capture_output=True, text=True
-            )
-
-    oov_pct_total = oov_count / len(words)
-    oov_pct_sent = oov_sents / sent_count
-
     if verbose:
+        oov_pct_total = oov_count / len(words)
+        oov_pct_sent = oov_sents / sent_count
         print("-----------")
         print(
             f"Total OOV percentage: "
@@ -209,7 +491,83 @@ def parse_sents(
         )
         print("-----------")
 
-    return oov_pct_total, oov_pct_sent
+    return oov_count, len(words), oov_sents, sent_count
+
+
+def classify_sents(
+    response_path,
+    prompt_grammar,
+    control_grammars,
+    batch_size,
+    oov_stats=None,
+    classifier=None,
+    verbose=False
+):
+    """
+    Single-pass alternative to `parse_sents` for the `batch` dataset.
+
+    Every sentence is parsed once with the combined grammar, which tells
+    the sentence types it realises along with its LF under each control
+    grammar (see `classify.TypeClassifier`). If the sentences of a batch
+    all realise some type, but not in the order of the prompt, they are
+    moved to the slots of their types and their sentence files are
+    rewritten, so misnumbered batches are kept instead of discarded.
+
+    Returns the OOV counts like `parse_sents`.
+    """
+    assert len(control_grammars) == batch_size
+    if classifier is None:
+        classifier = TypeClassifier(control_grammars)
+
+    sent_paths = [
+        create_out_path(
+            f"output/english/{i + 1}/",
+            response_path,
+            check_exists=False,
+            ext=".txt"
+        )
+        for i in range(batch_size)
+    ]
+
+    if oov_stats is None:
+        lex = load_lexicon(prompt_grammar)
+        oov_stats = [
+            lexical_parse(sent_path, lex, show_oov=verbose)
+            for sent_path in sent_paths
+        ]
+
+    sents = [read_sents(sent_path) for sent_path in sent_paths]
+    lfs = {
+        sent: classifier.parse(
+            sent, timeout=SENTENCE_TIMEOUT, max_items=MAX_CHART_ITEMS
+        )
+        for type_sents in sents for sent in type_sents
+    }
+
+    n_moved = 0
+    for j, batch in enumerate(zip(*sents)):
+        order = assign_types([get_types(lfs[sent]) for sent in batch])
+        if order is not None and order != list(range(batch_size)):
+            for k, i in enumerate(order):
+                sents[k][j] = batch[i]
+            n_moved += 1
+
+    for i, sent_path in enumerate(sent_paths):
+        if n_moved:
+            with open(sent_path, "w") as f:
+                f.write(en_header + "\n".join(sents[i]) + "\n")
+
+        varfree_path = sent_path.replace("english", "varfree_lf")
+        with open(varfree_path, "w") as f:
+            f.write("".join(lfs[sent][i] + "\n" for sent in sents[i]))
+
+    if verbose:
+        print(
+            f"Classified {len(lfs)} sentences with {classifier.grammar.path}"
+            f" ({n_moved} batches re-bucketed)"
+        )
+
+    return get_oov_counts(oov_stats, verbose=verbose)
 
 
 def main():
@@ -257,6 +615,39 @@ def main():
         type=int,
         help="Recursion depth for generalization sentences"
     )
+    parser.add_argument(
+        "-j", "--n_jobs",
+        type=int,
+        help="Number of sentence types to parse concurrently"
+    )
+    parser.add_argument(
+        "--python_parser",
+        action="store_true",
+        help="Parse with the pure-Python IRTG parser instead of Alto"
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Parse sentences that the EBNF recognizer rejects as well"
+    )
+    parser.add_argument(
+        "--no_parse_cache",
+        action="store_true",
+        help="Parse every sentence instead of reusing cached parses"
+    )
+    parser.add_argument(
+        "--derivations",
+        action="store_true",
+        help="Save the rule ids of every derivation to output/derivations"
+    )
+    parser.add_argument(
+        "--classify",
+        action="store_true",
+        help=(
+            "Parse once with the combined grammar and re-bucket "
+            "misnumbered sentences (batch only)"
+        )
+    )
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -264,6 +655,10 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.classify and args.dataset_type != "batch":
+        parser.error("--classify only supports the batch dataset")
+    if args.classify and args.derivations:
+        parser.error("--classify does not save derivations")
 
     dataset_type = args.dataset_type
     response_path = args.response_path
@@ -293,13 +688,40 @@ def main():
 
     format_sents(dataset_type, response_path, batch_size, n_batches, verbose)
 
-    oov_pct_total, oov_pct_sent = parse_sents(
+    if args.classify:
+        classify_sents(
+            response_path,
+            prompt_grammar,
+            control_grammars,
+            batch_size,
+            verbose=verbose
+        )
+        return
+
+    # Only Alto's one-off ParsingEvaluator cannot report derivations
+    if args.python_parser:
+        pool = PythonParserPool(derivations=args.derivations)
+    elif args.derivations:
+        pool = ParserPool(
+            get_command=partial(get_alto_command, derivations=True)
+        )
+    else:
+        pool = None
+
+    parse_sents(
         response_path,
         prompt_grammar,
         control_grammars,
         batch_size,
+        cache=None if args.no_parse_cache else ParseCache(),
+        prefilter=not args.no_prefilter,
+        pool=pool,
+        n_jobs=args.n_jobs,
+        derivations=args.derivations,
         verbose=verbose
     )
+    if pool is not None:
+        pool.close()
 
 
 if __name__ == "__main__":
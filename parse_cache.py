@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", ".cache/parses")
+
+
+@lru_cache(maxsize=32)
+def _hash_grammar(grammar_path, mtime):
+    with open(grammar_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_grammar_hash(grammar_path):
+    """Content hash of a grammar file, computed once per modification."""
+    grammar_path = os.path.abspath(grammar_path)
+    return _hash_grammar(grammar_path, os.stat(grammar_path).st_mtime_ns)
+
+
+def normalize_key(sent):
+    return " ".join(sent.split())
+
+
+class ParseCache:
+    """
+    Persistent cache of parse results (varfree LFs, including <null>).
+
+    The results of each control grammar are stored as one JSON file named
+    after the hash of the grammar's content, mapping the normalised
+    sentences to their LFs. Editing a grammar therefore never serves
+    stale parses, while sentences that recur across prompts, loops and
+    runs are only parsed once.
+    """
+
+    def __init__(self, cache_dir=PARSE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, grammar_hash):
+        return os.path.join(self.cache_dir, grammar_hash + ".json")
+
+    def _read(self, grammar_hash):
+        path = self._entry_path(grammar_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _load(self, grammar_hash):
+        if grammar_hash not in self._entries:
+            self._entries[grammar_hash] = self._read(grammar_hash)
+        return self._entries[grammar_hash]
+
+    def get(self, grammar_path, sents):
+        """
+        Look up the LFs of the sentences under the given grammar. Returns
+        one LF per sentence, or None where the sentence was not cached.
+        """
+        grammar_hash = get_grammar_hash(grammar_path)
+        with self._lock:
+            entries = self._load(grammar_hash)
+            lfs = [entries.get(normalize_key(sent)) for sent in sents]
+
+            n_misses = lfs.count(None)
+            self.misses += n_misses
+            self.hits += len(lfs) - n_misses
+
+        return lfs
+
+    def put(self, grammar_path, sents, lfs):
+        if not sents:
+            return
+
+        grammar_hash = get_grammar_hash(grammar_path)
+        with self._lock:
+            entries = self._load(grammar_hash)
+            entries.update(
+                (normalize_key(sent), lf) for sent, lf in zip(sents, lfs)
+            )
+
+            # Merge with entries written by other processes in the meantime,
+            # then replace the file at once so readers never see a partial
+            # write
+            entries.update(
+                (sent, lf) for sent, lf in self._read(grammar_hash).items()
+                if sent not in entries
+            )
+            path = self._entry_path(grammar_hash)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
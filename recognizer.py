@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+
+from generation.grammar import get_ebnf_path, load_grammar
+
+
+class Recognizer:
+    """
+    Membership test for the language of an EBNF grammar, used to reject
+    sentences before they reach the semantic parser.
+
+    The lexicon is compiled into an index from each word to its
+    categories, so sentences with an unknown word are rejected with a
+    single set lookup. All other sentences go through an Earley
+    recognizer over the grammar rules, where single-word lexicon entries
+    are scanned through the index instead of being predicted one by one.
+    """
+
+    def __init__(self, grammar, start="S"):
+        self.start = start
+
+        alternatives = {}
+        for lhs, words in grammar.categories.items():
+            alternatives.setdefault(lhs, []).extend(
+                tuple(str(alternative).split()) for alternative in words
+            )
+        for lhs, rhs in grammar.productions.items():
+            alternatives.setdefault(lhs, []).extend(rhs)
+
+        # Lexicon entries may also refer to other categories (e.g. rules
+        # placed before the `S` rule), so a symbol is a nonterminal
+        # whenever it has alternatives of its own
+        self.nonterminals = frozenset(alternatives)
+        self.word_categories = {}
+        self.rules = {}
+        for lhs, alts in alternatives.items():
+            for symbols in alts:
+                if not symbols:
+                    continue
+                if len(symbols) == 1 and symbols[0] not in self.nonterminals:
+                    self.word_categories.setdefault(symbols[0], set()).add(lhs)
+                else:
+                    self.rules.setdefault(lhs, []).append(tuple(symbols))
+
+        self.words = frozenset(
+            symbol
+            for alts in alternatives.values()
+            for symbols in alts
+            for symbol in symbols
+            if symbol not in self.nonterminals
+        )
+
+    def accepts(self, sent):
+        tokens = sent.split()
+        if not tokens or any(token not in self.words for token in tokens):
+            return False
+
+        n = len(tokens)
+        # Items are (lhs, symbols, dot, origin); `waiting[k][symbol]` holds
+        # the items of position k whose next symbol is `symbol`
+        charts = [[] for _ in range(n + 1)]
+        seen = [set() for _ in range(n + 1)]
+        waiting = [{} for _ in range(n + 1)]
+        predicted = [set() for _ in range(n + 1)]
+
+        def add(k, item):
+            if item not in seen[k]:
+                seen[k].add(item)
+                charts[k].append(item)
+
+        for symbols in self.rules.get(self.start, ()):
+            add(0, (self.start, symbols, 0, 0))
+        predicted[0].add(self.start)
+
+        for k in range(n + 1):
+            categories = (
+                self.word_categories.get(tokens[k], ()) if k < n else ()
+            )
+            chart = charts[k]
+            i = 0
+            while i < len(chart):
+                lhs, symbols, dot, origin = chart[i]
+                i += 1
+
+                if dot == len(symbols):
+                    for waiting_lhs, waiting_symbols, waiting_dot, start in (
+                        waiting[origin].get(lhs, ())
+                    ):
+                        add(k, (
+                            waiting_lhs, waiting_symbols, waiting_dot + 1,
+                            start
+                        ))
+                    continue
+
+                symbol = symbols[dot]
+                if symbol not in self.nonterminals:
+                    if k < n and tokens[k] == symbol:
+                        add(k + 1, (lhs, symbols, dot + 1, origin))
+                    continue
+
+                waiting[k].setdefault(symbol, []).append(
+                    (lhs, symbols, dot, origin)
+                )
+                if symbol in categories:
+                    add(k + 1, (lhs, symbols, dot + 1, origin))
+                if symbol not in predicted[k]:
+                    predicted[k].add(symbol)
+                    for rhs in self.rules.get(symbol, ()):
+                        add(k, (symbol, rhs, 0, k))
+
+        return any(
+            lhs == self.start and dot == len(symbols) and origin == 0
+            for lhs, symbols, dot, origin in charts[n]
+        )
+
+
+@lru_cache(maxsize=32)
+def _get_recognizer(grammar):
+    return Recognizer(grammar)
+
+
+def get_recognizer(grammar_path):
+    """
+    Recognizer for the EBNF version of a grammar, or None if the grammar
+    has no EBNF file.
+    """
+    if not os.path.exists(get_ebnf_path(grammar_path)):
+        return None
+    return _get_recognizer(load_grammar(grammar_path))
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from alto_worker import get_alto_command
+from irtg_parser import get_python_command
+from utils import null_lf, timeout_lf
+
+
+# Sentences per chunk and seconds a chunk may take (including the start
+# of the parser) before it is killed and retried
+CHUNK_SIZE = 500
+CHUNK_TIMEOUT = 600
+
+with open("lexicon/proper_nouns.json") as propN_file:
+    proper_nouns = frozenset(json.load(propN_file))
+
+
+def run_parser(command, sents, timeout=None):
+    """
+    Parse the sentences with a one-off parser process that speaks the
+    line protocol of `alto_worker.py`. Raises `subprocess.TimeoutExpired`
+    (after killing the process) or `RuntimeError` if the parse fails.
+    """
+    result = subprocess.run(
+        command,
+        input="".join(sent + "\n" for sent in sents),
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        timeout=timeout,
+    )
+    lfs = result.stdout.splitlines()
+    if result.returncode != 0 or len(lfs) != len(sents):
+        raise RuntimeError(
+            f"Parser exited with code {result.returncode} after "
+            f"{len(lfs)} / {len(sents)} sentences: {result.stderr.strip()}"
+        )
+    return lfs
+
+
+class ShardedParser:
+    """
+    Parser for large corpora: the sentences are split into chunks of
+    `chunk_size`, which are parsed by up to `n_workers` parser processes
+    at a time and merged back in their original order.
+
+    Every chunk has its own timeout and is retried `retries` times. A
+    chunk that keeps failing is split in halves that are re-run on their
+    own, so a single pathological sentence only costs its own parse
+    (it ends up as <timeout> if it ran out of time, <null> otherwise)
+    instead of the whole file.
+
+    The interface matches `alto_worker.ParserPool`, so it can be passed
+    to `parse.parse_sents` as `pool`.
+    """
+
+    def __init__(
+        self,
+        get_command=get_alto_command,
+        chunk_size=CHUNK_SIZE,
+        n_workers=None,
+        timeout=CHUNK_TIMEOUT,
+        retries=1,
+        verbose=False
+    ):
+        self.get_command = get_command
+        self.chunk_size = chunk_size
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retries = retries
+        self.verbose = verbose
+
+    def parse_chunk(self, command, sents):
+        error = None
+        for _ in range(self.retries + 1):
+            try:
+                return run_parser(command, sents, timeout=self.timeout)
+            except (subprocess.TimeoutExpired, RuntimeError) as e:
+                error = e
+
+        if len(sents) == 1:
+            print(f"Giving up on \"{sents[0]}\": {error}")
+            if isinstance(error, subprocess.TimeoutExpired):
+                return [timeout_lf]
+            return [null_lf]
+
+        if self.verbose:
+            print(f"Splitting failed chunk of {len(sents)} sentences")
+        mid = len(sents) // 2
+        return (
+            self.parse_chunk(command, sents[:mid])
+            + self.parse_chunk(command, sents[mid:])
+        )
+
+    def parse(self, grammar_path, sents, on_lf=None):
+        command = self.get_command(grammar_path)
+        chunks = [
+            sents[i:i + self.chunk_size]
+            for i in range(0, len(sents), self.chunk_size)
+        ]
+
+        def parse_chunk(idx):
+            lfs = self.parse_chunk(command, chunks[idx])
+            if self.verbose:
+                print(f"Parsed chunk {idx + 1} / {len(chunks)}")
+            return lfs
+
+        # Threads are enough, as the parsers run in their own processes.
+        # `map` keeps the chunks in order for `on_lf`
+        lfs = []
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            for chunk_lfs in executor.map(parse_chunk, range(len(chunks))):
+                for lf in chunk_lfs:
+                    if on_lf is not None:
+                        on_lf(len(lfs), lf)
+                    lfs.append(lf)
+
+        return lfs
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def normalize_cogs_sent(sent):
+    """
+    Turn a COGS source sentence into the format of our grammars, e.g.
+    "The sailor dusted a boy ." into "the sailor dusted a boy".
+    """
+    words = sent.split()
+    if words and words[-1] == ".":
+        words = words[:-1]
+    if words and words[0] not in proper_nouns:
+        words[0] = words[0].lower()
+    return " ".join(words)
+
+
+def read_corpus(corpus_path):
+    """
+    Read the sentences of a corpus: the first column of a TSV file such
+    as `data/base/train-COGS.tsv`, or an Alto corpus file otherwise.
+    """
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        if corpus_path.endswith(".tsv"):
+            return [
+                normalize_cogs_sent(line.split("\t")[0])
+                for line in f if line.strip()
+            ]
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.startswith("//")
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parse a large corpus in parallel, order-preserving chunks"
+    )
+    parser.add_argument(
+        "grammar_path",
+        type=str,
+        help="Path to the IRTG grammar file"
+    )
+    parser.add_argument(
+        "corpus_path",
+        type=str,
+        help="TSV file (sentences in the first column) or Alto corpus file"
+    )
+    parser.add_argument(
+        "out_path",
+        type=str,
+        help="Output file with one varfree LF per sentence"
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of sentences per chunk"
+    )
+    parser.add_argument(
+        "-j", "--n_workers",
+        type=int,
+        help="Number of chunks to parse in parallel (default: CPU count)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=CHUNK_TIMEOUT,
+        help="Seconds after which a chunk is killed and retried"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Number of retries before a failing chunk is split"
+    )
+    parser.add_argument(
+        "--python_parser",
+        action="store_true",
+        help="Parse with the pure-Python IRTG parser instead of Alto"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("The chunk size must be at least 1")
+
+    sents = read_corpus(args.corpus_path)
+    sharded_parser = ShardedParser(
+        get_command=(
+            get_python_command if args.python_parser else get_alto_command
+        ),
+        chunk_size=args.chunk_size,
+        n_workers=args.n_workers,
+        timeout=args.timeout,
+        retries=args.retries,
+        verbose=args.verbose
+    )
+    lfs = sharded_parser.parse(args.grammar_path, sents)
+
+    os.makedirs(os.path.dirname(args.out_path) or ".", exist_ok=True)
+    with open(args.out_path, "w", encoding="utf-8") as f:
+        f.write("".join(lf + "\n" for lf in lfs))
+
+    n_null = lfs.count(null_lf)
+    n_timeout = lfs.count(timeout_lf)
+    print(
+        f"Saved {len(lfs)} parses to {args.out_path} "
+        f"({n_null} without a parse, {n_timeout} timed out)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import main as pipeline
+from generation.config import DEFAULT_MODEL
+from generation.ctx_len import get_encoding
+from generation.grammar import load_grammar
+from generation.utils import default_scheduler
+from utils import get_safe_filename
+
+
+# Positional arguments of `main.py`, in order
+positional_args = ["dataset_type", "grammar_path", "n_prompts", "n_batches"]
+
+
+def expand_grid(grid):
+    """
+    Expand a grid into a list of configurations. List values are swept
+    over (as a cartesian product), all other values are shared by every
+    configuration. A list of grids is expanded one after the other.
+    """
+    if isinstance(grid, list):
+        return [config for g in grid for config in expand_grid(g)]
+
+    keys = list(grid)
+    values = [
+        grid[key] if isinstance(grid[key], list) else [grid[key]]
+        for key in keys
+    ]
+    return [dict(zip(keys, combination))
+            for combination in itertools.product(*values)]
+
+
+def config_to_argv(config):
+    """Turn a configuration into the command line arguments of `main.py`."""
+    argv = [
+        str(config[key]) for key in positional_args
+        if config.get(key) is not None
+    ]
+    for key, value in config.items():
+        if key in positional_args or value is None or value is False:
+            continue
+        argv.append(f"--{key}")
+        if value is not True:
+            argv.append(str(value))
+    return argv
+
+
+def init_worker(limiter, n_workers):
+    # The rate limits apply to the whole account, so every worker gets its
+    # share, while the limiter bounds the requests in flight across workers
+    default_scheduler.limiter = limiter
+    default_scheduler.rpm = max(1, default_scheduler.rpm // n_workers)
+    default_scheduler.tpm = max(1, default_scheduler.tpm // n_workers)
+
+
+def run_config(idx, config, argv):
+    row = {"idx": idx, "config": config}
+    try:
+        row["metrics"] = pipeline.run(pipeline.parse_args(argv))
+    except Exception as e:
+        row["error"] = repr(e)
+    return row
+
+
+def sweep(grid, n_workers, max_in_flight, sweep_name="sweep", verbose=False):
+    """
+    Run the pipeline for every configuration of the grid in a pool of
+    `n_workers` processes, with at most `max_in_flight` API requests in
+    flight across all of them. One metrics row per configuration is
+    appended to a JSONL file as soon as it finishes.
+    """
+    configs = expand_grid(grid)
+
+    # Validate every configuration before any request is sent, and give
+    # each one its own output name so the runs do not race for file names
+    argvs = []
+    for i, config in enumerate(configs):
+        config.setdefault("name", f"{sweep_name}-{i}")
+        if verbose:
+            config.setdefault("verbose", True)
+        argv = config_to_argv(config)
+        pipeline.parse_args(argv)
+        argvs.append(argv)
+
+    # Loaded once here, the grammars and the tokenizer are inherited by
+    # forked workers instead of being loaded again by every configuration
+    for config in configs:
+        load_grammar(config["grammar_path"])
+    get_encoding(DEFAULT_MODEL)
+
+    metrics_path = get_safe_filename(f"data/metrics/{sweep_name}.jsonl")
+    os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+
+    limiter = multiprocessing.BoundedSemaphore(max_in_flight)
+    n_workers = min(n_workers, len(configs))
+    n_failed = 0
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=init_worker,
+        initargs=(limiter, n_workers)
+    )
+    with executor, open(metrics_path, "w") as f:
+        futures = [
+            executor.submit(run_config, i, config, argv)
+            for i, (config, argv) in enumerate(zip(configs, argvs))
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            f.write(json.dumps(row) + "\n")
+            f.flush()
+
+            if "error" in row:
+                n_failed += 1
+                print(f"Config {row['idx']} failed: {row['error']}")
+            else:
+                print(f"Config {row['idx']} finished")
+
+    print(
+        f"Saved {len(configs)} metrics row(s) to {metrics_path}"
+        + (f" ({n_failed} failed)" if n_failed else "")
+    )
+    return metrics_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the pipeline for a grid of configurations"
+    )
+    parser.add_argument(
+        "grid_path",
+        type=str,
+        help=(
+            "JSON file with the grid of configurations, keyed by the "
+            "argument names of main.py"
+        )
+    )
+    parser.add_argument(
+        "-j", "--n_workers",
+        type=int,
+        default=4,
+        help="Number of configurations to run in parallel"
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=16,
+        help="Maximum number of API requests in flight across all workers"
+    )
+    parser.add_argument(
+        "--name",
+        type=str,
+        default="sweep",
+        help="Name of the sweep, used as prefix of the output files"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+    if args.n_workers < 1 or args.max_in_flight < 1:
+        parser.error("--n_workers and --max_in_flight must be at least 1")
+
+    with open(args.grid_path, "r") as f:
+        grid = json.load(f)
+
+    sweep(
+        grid,
+        args.n_workers,
+        args.max_in_flight,
+        sweep_name=args.name,
+        verbose=args.verbose
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,11 @@ en_header = """
 
 """
 
+# Parse outcomes besides a varfree LF: no parse exists, or the parse went
+# over its time or memory budget
+null_lf = "<null>"
+timeout_lf = "<timeout>"
+
 
 def create_out_path(base_dir, response_path, check_exists, ext):
     filename = os.path.basename(response_path)